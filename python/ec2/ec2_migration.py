@@ -5,8 +5,12 @@ Migrates instances with names prefixed with 'branch' to new instance types and g
 """
 
 import boto3
-import time
-from botocore.exceptions import ClientError
+from itertools import chain
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
+from botocore.exceptions import ClientError, WaiterError
+from botocore.waiter import WaiterModel, create_waiter_with_client
 
 # Instance type mapping
 INSTANCE_TYPE_MAP = {
@@ -16,17 +20,62 @@ INSTANCE_TYPE_MAP = {
 }
 
 # Configuration
-WAIT_TIME_AFTER_STOP = 30  # seconds to wait after stopping
-WAIT_TIME_AFTER_MODIFICATIONS = 60  # seconds to wait after all modifications
+VOLUME_WAITER_DELAY = 5  # seconds between volume modification polls
+VOLUME_WAITER_MAX_ATTEMPTS = 24  # polls before giving up on volume modifications
 PREFIX = 'branch'
+SKIP_NAMES = frozenset({'branch2.testtss.com', 'branch1.devtss.com', 'branch4.devtss.com'})
+ACTIVE_INSTANCE_STATES = ['pending', 'running', 'stopping', 'stopped']
+MAX_WORKERS = 16  # upper bound on instances migrated concurrently
+FILTER_VALUES_LIMIT = 200  # max values EC2 accepts in a single filter
+
+# Shared client settings: room for concurrent workers and adaptive retries on throttling
+BOTO_CONFIG = Config(
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True
+)
+
+# EC2 has no built-in waiter for volume modifications. A modification only
+# needs to leave the 'modifying' state before the instance can be started;
+# 'optimizing' continues in the background.
+VOLUME_MODIFICATION_WAITER_MODEL = WaiterModel({
+    'version': 2,
+    'waiters': {
+        'VolumeModificationReady': {
+            'operation': 'DescribeVolumesModifications',
+            'delay': VOLUME_WAITER_DELAY,
+            'maxAttempts': VOLUME_WAITER_MAX_ATTEMPTS,
+            'acceptors': [
+                {
+                    # A modification can take a moment to become visible
+                    'state': 'retry',
+                    'matcher': 'error',
+                    'expected': 'InvalidVolumeModification.NotFound'
+                },
+                {
+                    'state': 'failure',
+                    'matcher': 'pathAny',
+                    'argument': 'VolumesModifications[].ModificationState',
+                    'expected': 'failed'
+                },
+                {
+                    'state': 'success',
+                    'matcher': 'path',
+                    'argument': "length(VolumesModifications[?ModificationState == 'modifying']) == `0`",
+                    'expected': True
+                }
+            ]
+        }
+    }
+})
+
+def _tags_dict(instance):
+    """Return an instance's tags as a {Key: Value} dict"""
+    return {tag['Key']: tag['Value'] for tag in instance.get('Tags', ())}
 
 def get_instance_name(instance):
     """Extract the Name tag from an instance"""
-    if 'Tags' in instance:
-        for tag in instance['Tags']:
-            if tag['Key'] == 'Name':
-                return tag['Value']
-    return None
+    return _tags_dict(instance).get('Name')
 
 def stop_instance(ec2_client, instance_id, instance_name):
     """Stop an EC2 instance"""
@@ -57,38 +106,58 @@ def change_instance_type(ec2_client, instance_id, instance_name, current_type, n
         print(f"Error changing instance type for {instance_name}: {e}")
         return False
 
-def convert_volumes_to_gp3(ec2_client, instance_id, instance_name):
-    """Convert all gp2 volumes attached to instance to gp3"""
-    print(f"Converting volumes to gp3 for {instance_name}...")
+def wait_for_volume_modifications(ec2_client, volume_ids, instance_name):
+    """Wait until volume modifications are far enough along to start the instance"""
+    print(f"Waiting for volume modifications to complete for {instance_name}...")
     try:
-        # Get all volumes attached to the instance
-        response = ec2_client.describe_volumes(
+        waiter = create_waiter_with_client(
+            'VolumeModificationReady', VOLUME_MODIFICATION_WAITER_MODEL, ec2_client
+        )
+        waiter.wait(VolumeIds=volume_ids)
+        print(f"Volume modifications ready for {instance_name}")
+        return True
+    except WaiterError as e:
+        print(f"Error waiting for volume modifications for {instance_name}: {e}")
+        return False
+
+def collect_gp2_volumes(ec2_client, instance_ids):
+    """Map each instance ID to the IDs of its attached gp2 volumes"""
+    gp2_volumes = {instance_id: [] for instance_id in instance_ids}
+    paginator = ec2_client.get_paginator('describe_volumes')
+    
+    # EC2 caps the number of values per filter, so query in chunks
+    for i in range(0, len(instance_ids), FILTER_VALUES_LIMIT):
+        pages = paginator.paginate(
             Filters=[
-                {'Name': 'attachment.instance-id', 'Values': [instance_id]}
+                {'Name': 'attachment.instance-id', 'Values': instance_ids[i:i + FILTER_VALUES_LIMIT]},
+                {'Name': 'volume-type', 'Values': ['gp2']}
             ]
         )
-        
-        volumes_converted = 0
-        for volume in response['Volumes']:
-            volume_id = volume['VolumeId']
-            volume_type = volume['VolumeType']
-            
-            if volume_type == 'gp2':
-                print(f"  Converting volume {volume_id} from gp2 to gp3...")
-                ec2_client.modify_volume(
-                    VolumeId=volume_id,
-                    VolumeType='gp3'
-                )
-                volumes_converted += 1
-            else:
-                print(f"  Volume {volume_id} is already {volume_type}, skipping...")
-        
-        if volumes_converted > 0:
-            print(f"Initiated conversion of {volumes_converted} volume(s) for {instance_name}")
-        else:
-            print(f"No gp2 volumes found for {instance_name}")
-        
+        for page in pages:
+            for volume in page['Volumes']:
+                for attachment in volume['Attachments']:
+                    if attachment['InstanceId'] in gp2_volumes:
+                        gp2_volumes[attachment['InstanceId']].append(volume['VolumeId'])
+    
+    return gp2_volumes
+
+def convert_volumes_to_gp3(ec2_client, volume_ids, instance_name):
+    """Convert the given gp2 volumes attached to an instance to gp3"""
+    print(f"Converting volumes to gp3 for {instance_name}...")
+    if not volume_ids:
+        print(f"No gp2 volumes found for {instance_name}")
         return True
+    
+    try:
+        for volume_id in volume_ids:
+            print(f"  Converting volume {volume_id} from gp2 to gp3...")
+            ec2_client.modify_volume(
+                VolumeId=volume_id,
+                VolumeType='gp3'
+            )
+        
+        print(f"Initiated conversion of {len(volume_ids)} volume(s) for {instance_name}")
+        return wait_for_volume_modifications(ec2_client, volume_ids, instance_name)
     except ClientError as e:
         print(f"Error converting volumes for {instance_name}: {e}")
         return False
@@ -108,14 +177,14 @@ def start_instance(ec2_client, instance_id, instance_name):
         print(f"Error starting instance {instance_name}: {e}")
         return False
 
-def process_instance(ec2_client, instance):
+def process_instance(ec2_client, instance, gp2_volume_ids):
     """Process a single instance"""
     instance_id = instance['InstanceId']
     instance_name = get_instance_name(instance)
     current_type = instance['InstanceType']
     
     # Check if name starts with prefix
-    if not instance_name or not instance_name.startswith(PREFIX) or instance_name in ["branch2.testtss.com", "branch1.devtss.com", "branch4.devtss.com"]:
+    if not instance_name or not instance_name.startswith(PREFIX) or instance_name in SKIP_NAMES:
         print(f"Skipping instance {instance_id} - name '{instance_name}' doesn't start with '{PREFIX}'")
         return False
     
@@ -135,52 +204,52 @@ def process_instance(ec2_client, instance):
     if not stop_instance(ec2_client, instance_id, instance_name):
         return False
     
-    # Wait a bit after stopping
-    print(f"Waiting {WAIT_TIME_AFTER_STOP} seconds after stop...")
-    time.sleep(WAIT_TIME_AFTER_STOP)
-    
     # Step 2: Change instance type if needed
     if new_type:
         if not change_instance_type(ec2_client, instance_id, instance_name, current_type, new_type):
             print(f"Failed to change instance type, but will continue with volume conversion...")
     
-    # Step 3: Convert volumes to gp3
-    if not convert_volumes_to_gp3(ec2_client, instance_id, instance_name):
+    # Step 3: Convert volumes to gp3 and wait for the modifications to settle
+    if not convert_volumes_to_gp3(ec2_client, gp2_volume_ids, instance_name):
         print(f"Failed to convert volumes for {instance_name}")
     
-    # Step 4: Wait for processing to complete
-    print(f"Waiting {WAIT_TIME_AFTER_MODIFICATIONS} seconds for modifications to complete...")
-    time.sleep(WAIT_TIME_AFTER_MODIFICATIONS)
-    
-    # Step 5: Start the instance
+    # Step 4: Start the instance
     if not start_instance(ec2_client, instance_id, instance_name):
         return False
     
     print(f"Successfully processed instance {instance_name}")
     return True
 
+def process_instance_worker(instance, gp2_volume_ids):
+    """Process a single instance on a worker thread with its own EC2 client"""
+    ec2_client = boto3.session.Session().client('ec2', config=BOTO_CONFIG)
+    return process_instance(ec2_client, instance, gp2_volume_ids)
+
 def main():
     """Main function"""
     print("EC2 Instance Migration Script")
     print(f"Looking for instances with names starting with '{PREFIX}'...\n")
     
     # Initialize boto3 EC2 client
-    ec2_client = boto3.client('ec2')
+    ec2_client = boto3.client('ec2', config=BOTO_CONFIG)
     
     try:
         # Get all instances with names starting with prefix
-        response = ec2_client.describe_instances(
+        paginator = ec2_client.get_paginator('describe_instances')
+        pages = paginator.paginate(
             Filters=[
-                {'Name': 'tag:Name', 'Values': [f'{PREFIX}*']}
-            ]
+                {'Name': 'tag:Name', 'Values': [f'{PREFIX}*']},
+                # Leave terminated/terminating instances out of the response
+                {'Name': 'instance-state-name', 'Values': ACTIVE_INSTANCE_STATES}
+            ],
+            PaginationConfig={'PageSize': 1000}
         )
         
-        instances_to_process = []
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                # Skip terminated instances
-                if instance['State']['Name'] not in ['terminated', 'terminating']:
-                    instances_to_process.append(instance)
+        instances_to_process = list(chain.from_iterable(
+            reservation['Instances']
+            for page in pages
+            for reservation in page['Reservations']
+        ))
         
         if not instances_to_process:
             print(f"No instances found with names starting with '{PREFIX}'")
@@ -188,11 +257,28 @@ def main():
         
         print(f"Found {len(instances_to_process)} instance(s) to process\n")
         
-        # Process each instance
+        # Look up gp2 volumes for every instance in one pass
+        gp2_volumes = collect_gp2_volumes(
+            ec2_client, list(map(itemgetter('InstanceId'), instances_to_process))
+        )
+        
+        # Process instances concurrently - each one is dominated by waiting on AWS
         success_count = 0
-        for instance in instances_to_process:
-            if process_instance(ec2_client, instance):
-                success_count += 1
+        max_workers = min(MAX_WORKERS, len(instances_to_process))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    process_instance_worker, instance, gp2_volumes[instance['InstanceId']]
+                ): instance
+                for instance in instances_to_process
+            }
+            for future in as_completed(futures):
+                instance = futures[future]
+                try:
+                    if future.result():
+                        success_count += 1
+                except Exception as e:
+                    print(f"Error processing instance {instance['InstanceId']}: {e}")
         
         print(f"\n{'='*60}")
         print(f"Migration complete!")
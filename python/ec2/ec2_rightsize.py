@@ -6,139 +6,270 @@ Scans EC2 instances and CloudWatch metrics to provide rightsizing recommendation
 
 import csv
 import boto3
-import statistics
+import queue
+import functools
+import itertools
+import threading
+from botocore.config import Config
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 
+METRIC_DATA_QUERY_LIMIT = 500  # max MetricDataQueries per GetMetricData call
+METRIC_FETCH_WORKERS = 16  # concurrent GetMetricData batches across all regions
+ACTIVE_INSTANCE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+# Shared client settings: room for concurrent workers and adaptive retries on throttling
+BOTO_CONFIG = Config(
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True
+)
+
+# Hourly on-demand pricing. This is a simplified pricing model. For accurate
+# pricing, use AWS Price List API
+PRICING_MAP = {
+    't2.micro': 0.0116, 't2.small': 0.023, 't2.medium': 0.0464,
+    't3.micro': 0.0104, 't3.small': 0.0208, 't3.medium': 0.0416,
+    'm5.large': 0.096, 'm5.xlarge': 0.192, 'm5.2xlarge': 0.384,
+    'c5.large': 0.085, 'c5.xlarge': 0.17, 'c5.2xlarge': 0.34,
+    'r5.large': 0.126, 'r5.xlarge': 0.252, 'r5.2xlarge': 0.504
+}
+
+CSV_FIELDS = [
+    'InstanceId', 'Name', 'InstanceType', 'State', 'AvgCPU', 'MaxCPU', 'P95CPU',
+    'CurrentMonthlyCost', 'Recommendation', 'PotentialMonthlySavings', 'Region'
+]
+
+# Instance family mapping (simplified)
+DOWNSIZE_MAP = {
+    't3.medium': 't3.small',
+    't3.small': 't3.micro',
+    'm5.2xlarge': 'm5.xlarge',
+    'm5.xlarge': 'm5.large',
+    'm5.large': 't3.medium',
+    'c5.2xlarge': 'c5.xlarge',
+    'c5.xlarge': 'c5.large',
+    'c5.large': 't3.medium',
+    'r5.2xlarge': 'r5.xlarge',
+    'r5.xlarge': 'r5.large',
+    'r5.large': 'm5.large'
+}
+
+# Average CPU usage bands used for recommendations
+CPU_BUCKET_VERY_LOW = 0  # < 10%
+CPU_BUCKET_LOW = 1  # 10% - 25%
+CPU_BUCKET_OPTIMAL = 2  # 25% - 70%
+CPU_BUCKET_HIGH = 3  # > 70%
+
+# One worker pool shared by every analyzer in the run; each worker thread keeps
+# its own CloudWatch clients in _thread_local
+_metrics_executor = ThreadPoolExecutor(max_workers=METRIC_FETCH_WORKERS)
+_thread_local = threading.local()
+
+
+def percentile_95(values):
+    """Return the 95th percentile, same as statistics.quantiles(values, n=20)[18]"""
+    data = sorted(values)
+    ld = len(data)
+    if ld < 2:
+        return data[0]
+    # Only compute the one cut point we need using the 'exclusive' method
+    m = ld + 1
+    j = 19 * m // 20
+    j = 1 if j < 1 else ld - 1 if j > ld - 1 else j
+    delta = 19 * m - j * 20
+    return (data[j - 1] * (20 - delta) + data[j] * delta) / 20
+
+
+def _tags_dict(instance):
+    """Return an instance's tags as a {Key: Value} dict"""
+    return {tag['Key']: tag['Value'] for tag in instance.get('Tags', ())}
+
+
+def _fmt_row(row):
+    """Format a report row's numeric fields for CSV output"""
+    formatted = dict(row)
+    for field in ('AvgCPU', 'MaxCPU', 'P95CPU'):
+        value = row[field]
+        formatted[field] = 'N/A' if value is None else f"{value:.2f}%"
+    for field in ('CurrentMonthlyCost', 'PotentialMonthlySavings'):
+        value = row[field]
+        formatted[field] = 'N/A' if value is None else f"${value:.2f}"
+    return formatted
+
 
 class EC2RightsizingAnalyzer:
-    def __init__(self, region='us-east-1', days_to_analyze=30):
-        self.ec2 = boto3.client('ec2', region_name=region)
-        self.cloudwatch = boto3.client('cloudwatch', region_name=region)
+    def __init__(self, region='us-east-1', days_to_analyze=30, period=3600):
+        self.ec2 = boto3.client('ec2', region_name=region, config=BOTO_CONFIG)
         self.region = region
         self.days_to_analyze = days_to_analyze
+        # Metric period in seconds. 86400 (daily) returns 24x fewer datapoints and
+        # is fine for the average, but smooths out the max and p95 figures
+        self.period = period
         
     def get_all_instances(self):
         """Retrieve all EC2 instances"""
-        instances = []
         paginator = self.ec2.get_paginator('describe_instances')
+        pages = paginator.paginate(
+            # Leave terminated/shutting-down instances out of the response
+            Filters=[{'Name': 'instance-state-name', 'Values': ACTIVE_INSTANCE_STATES}],
+            PaginationConfig={'PageSize': 1000}
+        )
         
-        for page in paginator.paginate():
-            for reservation in page['Reservations']:
-                for instance in reservation['Instances']:
-                    if instance['State']['Name'] != 'terminated':
-                        instances.append(instance)
-        
-        return instances
+        return list(itertools.chain.from_iterable(
+            reservation['Instances']
+            for page in pages
+            for reservation in page['Reservations']
+        ))
     
-    def get_cloudwatch_metrics(self, instance_id, metric_name, stat='Average'):
-        """Get CloudWatch metrics for an instance"""
-        end_time = datetime.now(timezone.utc)
-        start_time = end_time - timedelta(days=self.days_to_analyze)
+    def get_thread_cloudwatch_client(self):
+        """Return a CloudWatch client for this region owned by the calling thread"""
+        # Cached per worker thread so connections are reused across batches and regions
+        clients = getattr(_thread_local, 'cloudwatch_clients', None)
+        if clients is None:
+            clients = _thread_local.cloudwatch_clients = {}
+        client = clients.get(self.region)
+        if client is None:
+            client = clients[self.region] = boto3.session.Session().client(
+                'cloudwatch', region_name=self.region, config=BOTO_CONFIG
+            )
+        return client
+    
+    def get_cpu_metrics_batch(self, instance_ids, start_time, end_time, period):
+        """Get CPUUtilization statistics for up to METRIC_DATA_QUERY_LIMIT instances"""
+        queries = [
+            {
+                'Id': f'm{idx}',
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EC2',
+                        'MetricName': 'CPUUtilization',
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                    },
+                    'Period': period,
+                    'Stat': 'Average'
+                },
+                'ReturnData': True
+            }
+            for idx, instance_id in enumerate(instance_ids)
+        ]
         
         try:
-            response = self.cloudwatch.get_metric_statistics(
-                Namespace='AWS/EC2',
-                MetricName=metric_name,
-                Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
+            values_by_id = defaultdict(list)
+            paginator = self.get_thread_cloudwatch_client().get_paginator('get_metric_data')
+            for page in paginator.paginate(
+                MetricDataQueries=queries,
                 StartTime=start_time,
                 EndTime=end_time,
-                Period=3600,  # 1 hour periods
-                Statistics=[stat]
-            )
-            
-            if response['Datapoints']:
-                values = [dp[stat] for dp in response['Datapoints']]
-                return {
-                    'avg': statistics.mean(values),
+                ScanBy='TimestampAscending'
+            ):
+                for result in page['MetricDataResults']:
+                    values_by_id[result['Id']].extend(result['Values'])
+        except Exception as e:
+            print(f"Error getting metrics for {len(instance_ids)} instances: {e}")
+            return {}
+        
+        metrics = {}
+        for idx, instance_id in enumerate(instance_ids):
+            values = values_by_id.get(f'm{idx}')
+            if values:
+                metrics[instance_id] = {
+                    'avg': sum(values) / len(values),
                     'max': max(values),
-                    'p95': statistics.quantiles(values, n=20)[18] if len(values) > 1 else values[0]
+                    'p95': percentile_95(values)
                 }
-            return None
-        except Exception as e:
-            print(f"Error getting metrics for {instance_id}: {e}")
-            return None
+        return metrics
     
-    def get_instance_pricing(self, instance_type):
-        """Estimate hourly cost (simplified - actual pricing varies by region and contract)"""
-        # This is a simplified pricing model. For accurate pricing, use AWS Price List API
-        pricing_map = {
-            't2.micro': 0.0116, 't2.small': 0.023, 't2.medium': 0.0464,
-            't3.micro': 0.0104, 't3.small': 0.0208, 't3.medium': 0.0416,
-            'm5.large': 0.096, 'm5.xlarge': 0.192, 'm5.2xlarge': 0.384,
-            'c5.large': 0.085, 'c5.xlarge': 0.17, 'c5.2xlarge': 0.34,
-            'r5.large': 0.126, 'r5.xlarge': 0.252, 'r5.2xlarge': 0.504
-        }
-        return pricing_map.get(instance_type, 0.10)  # Default estimate
-    
-    def suggest_rightsize(self, instance_type, cpu_avg, memory_avg):
-        """Suggest rightsizing based on utilization"""
-        # Instance family mapping (simplified)
-        downsize_map = {
-            't3.medium': 't3.small',
-            't3.small': 't3.micro',
-            'm5.2xlarge': 'm5.xlarge',
-            'm5.xlarge': 'm5.large',
-            'm5.large': 't3.medium',
-            'c5.2xlarge': 'c5.xlarge',
-            'c5.xlarge': 'c5.large',
-            'c5.large': 't3.medium',
-            'r5.2xlarge': 'r5.xlarge',
-            'r5.xlarge': 'r5.large',
-            'r5.large': 'm5.large'
-        }
+    def batch_get_cpu_metrics(self, instance_ids):
+        """Get CPUUtilization statistics for many instances, fetching batches concurrently"""
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(days=self.days_to_analyze)
+        batches = [
+            instance_ids[i:i + METRIC_DATA_QUERY_LIMIT]
+            for i in range(0, len(instance_ids), METRIC_DATA_QUERY_LIMIT)
+        ]
+        metrics = {}
         
-        recommendations = []
-        potential_savings = 0
+        futures = [
+            _metrics_executor.submit(self.get_cpu_metrics_batch, batch, start_time, end_time, self.period)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            metrics.update(future.result())
         
-        # CPU-based recommendation
-        if cpu_avg < 10:
-            recommendations.append("Very low CPU usage - consider stopping or downsizing")
-            if instance_type in downsize_map:
-                new_type = downsize_map[instance_type]
-                current_cost = self.get_instance_pricing(instance_type)
-                new_cost = self.get_instance_pricing(new_type)
+        return metrics
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def get_instance_pricing(instance_type):
+        """Estimate hourly cost (simplified - actual pricing varies by region and contract)"""
+        # Cached so a switch to the AWS Price List API only pays once per instance type
+        return PRICING_MAP.get(instance_type, 0.10)  # Default estimate
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _suggest_rightsize_cached(instance_type, cpu_bucket):
+        """Suggest rightsizing for an instance type and CPU usage band"""
+        if cpu_bucket == CPU_BUCKET_VERY_LOW:
+            # Very low CPU usage - consider stopping or downsizing
+            if instance_type in DOWNSIZE_MAP:
+                new_type = DOWNSIZE_MAP[instance_type]
+                current_cost = EC2RightsizingAnalyzer.get_instance_pricing(instance_type)
+                new_cost = EC2RightsizingAnalyzer.get_instance_pricing(new_type)
                 potential_savings = (current_cost - new_cost) * 730  # Monthly
                 return f"Downsize to {new_type}", potential_savings
-        elif cpu_avg < 25:
-            recommendations.append("Low CPU usage - good candidate for downsizing")
-            if instance_type in downsize_map:
-                new_type = downsize_map[instance_type]
-                current_cost = self.get_instance_pricing(instance_type)
-                new_cost = self.get_instance_pricing(new_type)
+        elif cpu_bucket == CPU_BUCKET_LOW:
+            # Low CPU usage - good candidate for downsizing
+            if instance_type in DOWNSIZE_MAP:
+                new_type = DOWNSIZE_MAP[instance_type]
+                current_cost = EC2RightsizingAnalyzer.get_instance_pricing(instance_type)
+                new_cost = EC2RightsizingAnalyzer.get_instance_pricing(new_type)
                 potential_savings = (current_cost - new_cost) * 730
                 return f"Consider downsizing to {new_type}", potential_savings
-        elif cpu_avg > 70:
+        elif cpu_bucket == CPU_BUCKET_HIGH:
             return "CPU usage high - current size appropriate or consider upsizing", 0
         else:
             return "Usage appears optimal", 0
         
         return "Review manually", 0
     
-    def analyze_instances(self):
-        """Main analysis function"""
+    def suggest_rightsize(self, instance_type, cpu_avg, memory_avg):
+        """Suggest rightsizing based on utilization"""
+        # CPU-based recommendation; only the usage band matters, so cache per band
+        if cpu_avg < 10:
+            cpu_bucket = CPU_BUCKET_VERY_LOW
+        elif cpu_avg < 25:
+            cpu_bucket = CPU_BUCKET_LOW
+        elif cpu_avg > 70:
+            cpu_bucket = CPU_BUCKET_HIGH
+        else:
+            cpu_bucket = CPU_BUCKET_OPTIMAL
+        return self._suggest_rightsize_cached(instance_type, cpu_bucket)
+    
+    def stream_instances(self):
+        """Main analysis function - yields one report row per instance"""
         instances = self.get_all_instances()
-        results = []
         
         print(f"Analyzing {len(instances)} instances...")
         
+        # Fetch CPU metrics up front, only for running instances - the rest
+        # get a "Stopped or no metrics available" row regardless
+        cpu_metrics_by_instance = self.batch_get_cpu_metrics(
+            [instance['InstanceId'] for instance in instances
+             if instance['State']['Name'] == 'running']
+        )
+        
         for idx, instance in enumerate(instances):
             instance_id = instance['InstanceId']
             instance_type = instance['InstanceType']
             state = instance['State']['Name']
             
-            # Get instance name
-            name = 'N/A'
-            if 'Tags' in instance:
-                for tag in instance['Tags']:
-                    if tag['Key'] == 'Name':
-                        name = tag['Value']
-                        break
+            name = _tags_dict(instance).get('Name', 'N/A')
             
             print(f"Processing {idx+1}/{len(instances)}: {instance_id} ({name})")
             
-            # Get metrics
-            cpu_metrics = self.get_cloudwatch_metrics(instance_id, 'CPUUtilization')
+            cpu_metrics = cpu_metrics_by_instance.get(instance_id)
             
             if cpu_metrics and state == 'running':
                 cpu_avg = cpu_metrics['avg']
@@ -151,78 +282,98 @@ class EC2RightsizingAnalyzer:
                 
                 current_monthly_cost = self.get_instance_pricing(instance_type) * 730
                 
-                results.append({
+                yield {
                     'InstanceId': instance_id,
                     'Name': name,
                     'InstanceType': instance_type,
                     'State': state,
-                    'AvgCPU': f"{cpu_avg:.2f}%",
-                    'MaxCPU': f"{cpu_max:.2f}%",
-                    'P95CPU': f"{cpu_p95:.2f}%",
-                    'CurrentMonthlyCost': f"${current_monthly_cost:.2f}",
+                    'AvgCPU': cpu_avg,
+                    'MaxCPU': cpu_max,
+                    'P95CPU': cpu_p95,
+                    'CurrentMonthlyCost': current_monthly_cost,
                     'Recommendation': recommendation,
-                    'PotentialMonthlySavings': f"${savings:.2f}",
+                    'PotentialMonthlySavings': savings,
                     'Region': self.region
-                })
+                }
             else:
-                results.append({
+                yield {
                     'InstanceId': instance_id,
                     'Name': name,
                     'InstanceType': instance_type,
                     'State': state,
-                    'AvgCPU': 'N/A',
-                    'MaxCPU': 'N/A',
-                    'P95CPU': 'N/A',
-                    'CurrentMonthlyCost': 'N/A',
+                    'AvgCPU': None,
+                    'MaxCPU': None,
+                    'P95CPU': None,
+                    'CurrentMonthlyCost': None,
                     'Recommendation': 'Stopped or no metrics available',
-                    'PotentialMonthlySavings': '$0.00',
+                    'PotentialMonthlySavings': 0.0,
                     'Region': self.region
-                })
-        
-        return results
+                }
     
-    def save_to_csv(self, results, filename='ec2_rightsizing_report_30.csv'):
-        """Save results to CSV"""
-        if not results:
+    @staticmethod
+    def save_to_csv(rows_iter, filename='ec2_rightsizing_report_30.csv'):
+        """Write rows to CSV as they are produced; returns the number of rows written"""
+        rows_iter = iter(rows_iter)
+        first_row = next(rows_iter, None)
+        if first_row is None:
             print("No results to save")
-            return
+            return 0
         
-        keys = results[0].keys()
+        row_count = 0
+        total_savings = 0.0
         with open(filename, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
             writer.writeheader()
-            writer.writerows(results)
+            for row in itertools.chain((first_row,), rows_iter):
+                writer.writerow(_fmt_row(row))
+                row_count += 1
+                total_savings += row['PotentialMonthlySavings']
         
         print(f"\nReport saved to: {filename}")
         
         # Print summary
-        total_savings = sum(
-            float(r['PotentialMonthlySavings'].replace('$', ''))
-            for r in results
-        )
         print(f"\nTotal Potential Monthly Savings: ${total_savings:.2f}")
         print(f"Total Potential Annual Savings: ${total_savings * 12:.2f}")
+        return row_count
 
 def main():
     # Initialize analyzer
     # You can specify different regions or analyze multiple regions
     regions = ['us-east-1']  # Add more regions as needed
+    # CloudWatch period in seconds: 3600 keeps hourly peaks in the max/p95
+    # columns; 86400 fetches 24x fewer datapoints when only averages matter
+    metric_period = 3600
     
-    all_results = []
-    
-    for region in regions:
+    def analyze_region(region, rows):
         print(f"\n{'='*60}")
         print(f"Analyzing region: {region}")
         print(f"{'='*60}")
         
-        analyzer = EC2RightsizingAnalyzer(region=region, days_to_analyze=14)
-        results = analyzer.analyze_instances()
-        all_results.extend(results)
+        try:
+            analyzer = EC2RightsizingAnalyzer(region=region, days_to_analyze=14, period=metric_period)
+            for row in analyzer.stream_instances():
+                rows.put(row)
+        finally:
+            rows.put(None)  # this region is done
     
-    # Save combined results
-    if all_results:
-        analyzer.save_to_csv(all_results)
-        
+    def stream_regions():
+        # Regions are independent, so analyze them concurrently and hand each
+        # row to the CSV writer as soon as it is produced
+        rows = queue.Queue()
+        with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            futures = [executor.submit(analyze_region, region, rows) for region in regions]
+            pending = len(futures)
+            while pending:
+                row = rows.get()
+                if row is None:
+                    pending -= 1
+                else:
+                    yield row
+            for future in futures:
+                future.result()  # re-raise a failed region
+    
+    # Save combined results as each region completes
+    if EC2RightsizingAnalyzer.save_to_csv(stream_regions()):
         print("\n" + "="*60)
         print("RECOMMENDATIONS SUMMARY")
         print("="*60)
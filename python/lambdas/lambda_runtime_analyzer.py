@@ -1,3 +1,6 @@
+import io
+import re
+import ast
 import boto3
 import csv
 import sys
@@ -7,14 +10,114 @@ import tempfile
 import shutil
 import subprocess
 import json
+import pickle
+import hashlib
+import threading
+import urllib.request
+from dataclasses import dataclass, astuple
 from datetime import datetime
-from collections import defaultdict
-from pathlib import Path
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.config import Config
 
-def check_aws_credentials():
+MAX_WORKERS = 16  # functions downloaded and scanned concurrently
+API_MAX_WORKERS = 32  # concurrent lightweight metadata calls (list_tags)
+SCAN_PARALLEL_MIN_FILES = 200  # .py files in a package before its scan is spread over threads
+
+# One connection pool sized for both worker pools, with keep-alive and adaptive retries
+BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True
+)
+
+# Python runtimes at 3.9 or below, i.e. the ones that need upgrading
+STALE_PYTHON_RUNTIMES = frozenset([
+    'python2.7', 'python3.6', 'python3.7', 'python3.8', 'python3.9'
+])
+
+# Bump TOOL_VERSION whenever the analysis changes to invalidate cached results
+TOOL_VERSION = '5'
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lambda_runtime_analyzer')
+
+EXTRACT_BUFFER_SIZE = 64 * 1024  # bytes per read/write when extracting zip entries
+
+VERMIN_TIMEOUT_PER_PATH = 30  # seconds of vermin time allowed per function
+# Per-file line of `vermin -v` output, e.g. "!2, 3.8      /tmp/x/app.py"
+VERMIN_FILE_LINE_RE = re.compile(r'^(?P<versions>[~!]?\d+(?:\.\d+)?(?:, [~!]?\d+(?:\.\d+)?)*)\s+(?P<path>\S.*)$')
+
+# Modules removed in Python 3.12, matched against the top-level name of each import
+DEPRECATED_MODULES = {
+    'distutils': 'distutils is removed in Python 3.12',
+    'imp': 'imp module is removed in Python 3.12',
+    'asynchat': 'asynchat is removed in Python 3.12',
+    'asyncore': 'asyncore is removed in Python 3.12',
+}
+# Known problematic requirements.txt packages (you can expand this list)
+KNOWN_ISSUES = {
+    'distutils': 'Removed in Python 3.12',
+    'imp': 'Removed in Python 3.12',
+}
+# Splits a requirement line like "pkg>=1.0; python_version<'3.8'" after the name
+_REQ_SPLIT = re.compile(r'[=<>!~;\[\s]')
+
+_MODULES_ALTERNATION = '|'.join(DEPRECATED_MODULES).encode()
+# Cheap bytes prefilter: files that never mention a deprecated module aren't parsed
+DEPRECATED_MENTION_RE = re.compile(rb'\b(?:' + _MODULES_ALTERNATION + rb')\b')
+# Fallback for sources ast can't parse (e.g. Python 2 syntax): import statements only
+IMPORT_LINE_RE = re.compile(
+    rb'^\s*(?:from|import)\s+(?P<module>' + _MODULES_ALTERNATION + rb')\b',
+    re.MULTILINE
+)
+
+class DeprecatedImportVisitor(ast.NodeVisitor):
+    """Collects the deprecated modules imported anywhere in a module"""
+    
+    def __init__(self):
+        self.found = set()
+    
+    def _check(self, module):
+        root = module.partition('.')[0]
+        if root in DEPRECATED_MODULES:
+            self.found.add(root)
+    
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._check(alias.name)
+    
+    def visit_ImportFrom(self, node):
+        # Relative imports refer to the package itself, not the stdlib
+        if node.module and not node.level:
+            self._check(node.module)
+
+def find_deprecated_imports(content, filename):
+    """Return the set of deprecated modules imported by a Python source given as bytes"""
+    if not DEPRECATED_MENTION_RE.search(content):
+        return set()
+    try:
+        # ast decodes bytes itself, honoring any coding cookie
+        tree = ast.parse(content, filename=filename)
+    except (SyntaxError, ValueError):
+        return {match.group('module').decode() for match in IMPORT_LINE_RE.finditer(content)}
+    visitor = DeprecatedImportVisitor()
+    visitor.visit(tree)
+    return visitor.found
+
+# Shared by all functions so large packages can't oversubscribe the machine
+_scan_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+# Serializes output from worker threads so lines don't interleave
+_print_lock = threading.Lock()
+
+def log(message):
+    """Print a message without interleaving with other worker threads"""
+    with _print_lock:
+        print(message)
+
+def check_aws_credentials(session):
     """Verify AWS credentials are configured"""
     try:
-        sts = boto3.client('sts')
+        sts = session.client('sts')
         identity = sts.get_caller_identity()
         print(f"✓ AWS Credentials validated")
         print(f"  Account: {identity['Account']}")
@@ -33,19 +136,14 @@ def check_aws_credentials():
 
 def check_compatibility_tools():
     """Check if compatibility checking tools are available"""
-    tools = {
-        'vermin': False,
-        'pyupgrade': False,
-        'pylint': False
-    }
+    # A PATH lookup is enough; running each tool's --version costs an interpreter start
+    tools = {tool: shutil.which(tool) is not None for tool in ('vermin', 'pyupgrade', 'pylint')}
     
     print("\nChecking for compatibility analysis tools...")
-    for tool in tools.keys():
-        try:
-            subprocess.run([tool, '--version'], capture_output=True, check=True, timeout=5)
-            tools[tool] = True
+    for tool, found in tools.items():
+        if found:
             print(f"  ✓ {tool} found")
-        except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
+        else:
             print(f"  ✗ {tool} not found (optional)")
     
     if not any(tools.values()):
@@ -55,13 +153,8 @@ def check_compatibility_tools():
     
     return tools
 
-def get_all_lambda_functions(region=None):
-    """Retrieve all Lambda functions in specified region"""
-    if region:
-        lambda_client = boto3.client('lambda', region_name=region)
-    else:
-        lambda_client = boto3.client('lambda')
-    
+def get_all_lambda_functions(lambda_client):
+    """Retrieve all Lambda functions in the client's region"""
     functions = []
     try:
         paginator = lambda_client.get_paginator('list_functions')
@@ -73,148 +166,188 @@ def get_all_lambda_functions(region=None):
     
     return functions
 
-def check_cloudformation_managed(function_name, lambda_client):
+def check_cloudformation_managed(function_name, function_arn, lambda_client):
     """Check if a Lambda function is managed by CloudFormation"""
     try:
-        response = lambda_client.get_function(FunctionName=function_name)
-        arn = response['Configuration']['FunctionArn']
-        tags_response = lambda_client.list_tags(Resource=arn)
+        # The ARN comes from list_functions, so only the tags need a round trip
+        tags_response = lambda_client.list_tags(Resource=function_arn)
         tags = tags_response.get('Tags', {})
         
         if 'aws:cloudformation:stack-name' in tags or 'aws:cloudformation:logical-id' in tags:
             return True, tags.get('aws:cloudformation:stack-name', 'N/A')
     except Exception as e:
-        print(f"  Warning: Could not check tags for {function_name}: {e}")
+        log(f"  Warning: Could not check tags for {function_name}: {e}")
     
     return False, None
 
-def download_lambda_code(function_name, lambda_client, temp_dir):
-    """Download Lambda function code for analysis"""
+def download_lambda_code(function_name, lambda_client):
+    """Download Lambda function code for analysis; returns an in-memory ZipFile"""
     try:
         response = lambda_client.get_function(FunctionName=function_name)
         code_location = response['Code']['Location']
         
-        # Download the zip file
-        import urllib.request
-        zip_path = os.path.join(temp_dir, f"{function_name}.zip")
-        urllib.request.urlretrieve(code_location, zip_path)
+        # Download the zip into memory - no intermediate .zip file on disk
+        with urllib.request.urlopen(code_location) as resp:
+            zip_buffer = io.BytesIO(resp.read())
         
-        # Extract zip
+        return zipfile.ZipFile(zip_buffer, 'r')
+    except Exception as e:
+        log(f"  Warning: Could not download code for {function_name}: {e}")
+        return None
+
+def extract_lambda_code(zf, function_name, temp_dir):
+    """Extract downloaded Lambda code to disk for tools that need files"""
+    try:
         extract_path = os.path.join(temp_dir, function_name)
         os.makedirs(extract_path, exist_ok=True)
-        
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
-        
+        for info in zf.infolist():
+            # Only sources are read from disk (by vermin); requirements.txt is read from the zip
+            if not info.filename.endswith('.py'):
+                continue
+            # Same safety as extractall: never write outside extract_path
+            name = os.path.normpath(info.filename)
+            if os.path.isabs(name) or name.startswith(os.pardir):
+                continue
+            target = os.path.join(extract_path, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zf.open(info) as src, open(target, 'wb', buffering=EXTRACT_BUFFER_SIZE) as dst:
+                shutil.copyfileobj(src, dst, length=EXTRACT_BUFFER_SIZE)
         return extract_path
     except Exception as e:
-        print(f"  Warning: Could not download code for {function_name}: {e}")
+        log(f"  Warning: Could not extract code for {function_name}: {e}")
         return None
 
-def check_python312_issues(code_path):
-    """Check for known Python 3.12 compatibility issues"""
-    issues = []
-    
-    # Known problematic imports/patterns in Python 3.12
-    deprecated_modules = [
-        'distutils',
-        'imp',
-        'asynchat',
-        'asyncore',
-        'smtpd'
-    ]
-    
-    warning_patterns = [
-        ('from distutils', 'distutils is removed in Python 3.12'),
-        ('import distutils', 'distutils is removed in Python 3.12'),
-        ('from imp import', 'imp module is removed in Python 3.12'),
-        ('import imp', 'imp module is removed in Python 3.12'),
-        ('asynchat', 'asynchat is removed in Python 3.12'),
-        ('asyncore', 'asyncore is removed in Python 3.12'),
+def _scan_entry(zf, info):
+    """Return the static issues found in one .py entry of the zip"""
+    try:
+        # Only real import statements count, not mentions in comments or strings
+        found = find_deprecated_imports(zf.read(info), info.filename)
+    except Exception:
+        return []
+    return [
+        {'file': info.filename, 'issue': message, 'severity': 'HIGH'}
+        for module, message in DEPRECATED_MODULES.items()
+        if module in found
     ]
+
+def check_python312_issues(zf):
+    """Check for known Python 3.12 compatibility issues, reading sources straight from the zip"""
+    issues = []
     
     try:
-        for py_file in Path(code_path).rglob('*.py'):
-            try:
-                with open(py_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    for pattern, message in warning_patterns:
-                        if pattern in content:
-                            issues.append({
-                                'file': str(py_file.relative_to(code_path)),
-                                'issue': message,
-                                'severity': 'HIGH'
-                            })
-            except Exception as e:
-                continue
+        # Nothing to scan in empty files (e.g. most __init__.py)
+        entries = [info for info in zf.infolist() if info.filename.endswith('.py') and info.file_size]
+        if len(entries) >= SCAN_PARALLEL_MIN_FILES:
+            # Large packages: zlib releases the GIL while inflating, so spread entries over threads
+            per_file = _scan_executor.map(lambda info: _scan_entry(zf, info), entries)
+        else:
+            per_file = (_scan_entry(zf, info) for info in entries)
+        for file_issues in per_file:
+            issues.extend(file_issues)
     except Exception as e:
-        print(f"  Warning during static analysis: {e}")
+        log(f"  Warning during static analysis: {e}")
     
     return issues
 
-def run_vermin(code_path):
-    """Run vermin to detect minimum Python version"""
+def _parse_vermin_version(version):
+    """Parse a vermin version like '3.8', '~3' or '!3' into (incompatible, (major, minor))"""
+    version = version.strip()
+    if version.startswith('!'):
+        return True, None
+    parts = version.lstrip('~').split('.')
+    return False, (int(parts[0]), int(parts[1]) if len(parts) > 1 else 0)
+
+def run_vermin_batch(code_paths):
+    """Run vermin once over many code paths; returns {code_path: vermin result}"""
+    if not code_paths:
+        return {}
+    
     try:
+        # -v prints the minimum versions of every file, which we group per code path
         result = subprocess.run(
-            ['vermin', '-t=3.12', '--no-tips', code_path],
+            ['vermin', '--no-tips', '-v', f'--processes={os.cpu_count() or 1}', *code_paths],
             capture_output=True,
             text=True,
-            timeout=30
+            timeout=VERMIN_TIMEOUT_PER_PATH * len(code_paths)
         )
+    except subprocess.TimeoutExpired:
+        return {path: {'compatible': None, 'output': 'Vermin timed out', 'min_version': 'Timeout'}
+                for path in code_paths}
+    except Exception as e:
+        return {path: {'compatible': None, 'output': str(e), 'min_version': 'Error'}
+                for path in code_paths}
+    
+    file_lines = defaultdict(list)
+    file_versions = defaultdict(list)
+    for line in (result.stdout + result.stderr).splitlines():
+        match = VERMIN_FILE_LINE_RE.match(line)
+        if not match:
+            continue
+        for path in code_paths:
+            if match.group('path').startswith(path + os.sep):
+                file_lines[path].append(line)
+                file_versions[path].append(match.group('versions').split(',')[-1])
+                break
+    
+    results = {}
+    for path in code_paths:
+        output = '\n'.join(file_lines[path])
+        if not file_versions[path]:
+            results[path] = {'compatible': None, 'output': output, 'min_version': 'Unknown'}
+            continue
         
-        output = result.stdout + result.stderr
-        
-        # Parse vermin output
-        if 'Minimum required versions' in output:
-            for line in output.split('\n'):
-                if 'Minimum required versions' in line:
-                    return {
-                        'compatible': '3.12' in line or result.returncode == 0,
-                        'output': output,
-                        'min_version': line.strip()
-                    }
+        parsed = [_parse_vermin_version(version) for version in file_versions[path]]
+        if any(incompatible for incompatible, _ in parsed):
+            results[path] = {
+                'compatible': False,
+                'output': output,
+                'min_version': 'Incompatible versions: 3'
+            }
+            continue
         
-        return {
-            'compatible': result.returncode == 0,
+        # The code needs the highest minimum of any of its files
+        major, minor = max(version for _, version in parsed)
+        results[path] = {
+            'compatible': (major, minor) <= (3, 12),
             'output': output,
-            'min_version': 'Unknown'
+            'min_version': f'Minimum required versions: {major}.{minor}'
         }
-    except subprocess.TimeoutExpired:
-        return {'compatible': None, 'output': 'Vermin timed out', 'min_version': 'Timeout'}
-    except Exception as e:
-        return {'compatible': None, 'output': str(e), 'min_version': 'Error'}
+    
+    return results
 
-def check_requirements_compatibility(code_path):
-    """Check if requirements.txt packages are compatible with Python 3.12"""
-    req_file = os.path.join(code_path, 'requirements.txt')
+def check_requirements_compatibility(zf):
+    """Check if requirements.txt packages are compatible with Python 3.12, reading it from the zip"""
     issues = []
     
-    if os.path.exists(req_file):
+    try:
+        data = zf.read('requirements.txt').decode('utf-8', 'ignore')
+    except KeyError:
+        data = None
+    
+    if data is not None:
         try:
-            with open(req_file, 'r') as f:
-                packages = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            packages = [line.strip() for line in data.splitlines() if line.strip() and not line.startswith('#')]
             
-            # Known problematic packages (you can expand this list)
-            known_issues = {
-                'distutils': 'Removed in Python 3.12',
-                'imp': 'Removed in Python 3.12',
-            }
-            
-            for pkg in packages:
-                pkg_name = pkg.split('==')[0].split('>=')[0].split('<=')[0].strip()
-                if pkg_name in known_issues:
-                    issues.append({
-                        'package': pkg,
-                        'issue': known_issues[pkg_name]
-                    })
+            # Map each package name to its full requirement line
+            names = {_REQ_SPLIT.split(pkg, 1)[0].lower(): pkg for pkg in packages}
+            for pkg_name in sorted(KNOWN_ISSUES.keys() & names.keys()):
+                issues.append({
+                    'package': names[pkg_name],
+                    'issue': KNOWN_ISSUES[pkg_name]
+                })
         except Exception as e:
-            print(f"  Warning: Could not analyze requirements.txt: {e}")
+            log(f"  Warning: Could not analyze requirements.txt: {e}")
     
     return issues
 
-def analyze_function_compatibility(function_name, lambda_client, temp_dir, tools_available):
-    """Perform comprehensive compatibility analysis on a Lambda function"""
-    print(f"  Analyzing {function_name}...")
+def analyze_function_compatibility(function_name, lambda_client, temp_dir=None):
+    """Download a Lambda function and run the in-process compatibility checks.
+    
+    Returns (result, code_path). The code is only extracted (to code_path) when
+    temp_dir is given, for vermin to run later over all functions at once; then
+    score_compatibility() fills in the score and recommendations.
+    """
+    log(f"  Analyzing {function_name}...")
     
     result = {
         'download_success': False,
@@ -226,24 +359,35 @@ def analyze_function_compatibility(function_name, lambda_client, temp_dir, tools
     }
     
     # Download code
-    code_path = download_lambda_code(function_name, lambda_client, temp_dir)
-    if not code_path:
+    zf = download_lambda_code(function_name, lambda_client)
+    if not zf:
         result['recommendations'].append('Could not download code for analysis')
-        return result
-    
-    result['download_success'] = True
-    
-    # Static analysis for known issues
-    result['static_issues'] = check_python312_issues(code_path)
-    
-    # Run vermin if available
-    if tools_available.get('vermin'):
-        result['vermin_result'] = run_vermin(code_path)
+        return result, None
+    
+    code_path = None
+    with zf:
+        # Only vermin reads from disk
+        if temp_dir:
+            code_path = extract_lambda_code(zf, function_name, temp_dir)
+            if not code_path:
+                result['recommendations'].append('Could not extract code for analysis')
+                return result, None
+        
+        result['download_success'] = True
+        
+        # Static analysis for known issues
+        result['static_issues'] = check_python312_issues(zf)
+        
+        # Check requirements.txt
+        result['requirements_issues'] = check_requirements_compatibility(zf)
     
-    # Check requirements.txt
-    result['requirements_issues'] = check_requirements_compatibility(code_path)
+    return result, code_path
+
+def score_compatibility(result):
+    """Calculate the compatibility score and recommendations for an analyzed function"""
+    if not result['download_success']:
+        return result
     
-    # Calculate compatibility score
     high_issues = len([i for i in result['static_issues'] if i['severity'] == 'HIGH'])
     req_issues = len(result['requirements_issues'])
     
@@ -262,16 +406,184 @@ def analyze_function_compatibility(function_name, lambda_client, temp_dir, tools
     
     return result
 
-def analyze_lambda_runtimes(output_csv='lambda_compatibility_report.csv', region=None, check_compatibility=True):
+def _cache_path(code_sha, tools_available):
+    """Return the cache file for a code package, or None if it has no CodeSha256"""
+    if not code_sha:
+        return None
+    # Vermin availability changes the result, so it is part of the key
+    key_source = f"{code_sha}:{TOOL_VERSION}:{bool(tools_available.get('vermin'))}"
+    cache_key = hashlib.sha256(key_source.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f"{cache_key}.pkl")
+
+def load_cached_result(code_sha, tools_available):
+    """Load a previous compatibility result for this code package, if any"""
+    cache_file = _cache_path(code_sha, tools_available)
+    if not cache_file or not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        log(f"  Warning: Could not read cache file {cache_file}: {e}")
+        return None
+
+def save_cached_result(code_sha, tools_available, result):
+    """Store a compatibility result keyed by the code package's CodeSha256"""
+    cache_file = _cache_path(code_sha, tools_available)
+    if not cache_file:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file first so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, cache_file)
+    except Exception as e:
+        log(f"  Warning: Could not write cache file {cache_file}: {e}")
+
+def known_good_path(output_csv):
+    """Return the known-good signature file kept next to the CSV report"""
+    return f"{os.path.splitext(output_csv)[0]}_known_good.json"
+
+def load_known_good(path):
+    """Load {CodeSha256: record} for code previously assessed LOW RISK"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"  Warning: Could not read known-good file {path}: {e}")
+        return {}
+
+def save_known_good(path, known_good):
+    """Write the known-good signatures, replacing the file atomically"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(known_good, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"  Warning: Could not write known-good file {path}: {e}")
+
+def _known_good_result(record, runtime, tools_available):
+    """Rebuild a LOW RISK result from a known-good record, or None if it doesn't apply"""
+    if not record or record.get('runtime') != runtime or record.get('tool_version') != TOOL_VERSION:
+        return None
+    # A record from a run without vermin doesn't vouch for a run with it
+    if tools_available.get('vermin') and not record.get('vermin_checked'):
+        return None
+    return {
+        'download_success': True,
+        'static_issues': [],
+        'vermin_result': record.get('vermin_result'),
+        'requirements_issues': [],
+        'compatibility_score': 'LOW RISK',
+        'recommendations': ['Safe to upgrade with testing']
+    }
+
+def _analyze_one(func, idx, total, lambda_client, temp_dir, tools_available, check_compatibility, known_good):
+    """Analyze a single function on a worker thread.
+    
+    Returns (compat_result, code_path, fresh). fresh is set when the result
+    was not cached and still needs scoring (after the vermin pass, over
+    code_path, if vermin is available).
+    """
+    runtime = func.get('Runtime', 'N/A')
+    func_name = func['FunctionName']
+    log(f"\n[{idx}/{total}] Found: {func_name} ({runtime})")
+    
+    # Compatibility analysis
+    compat_result = None
+    code_path = None
+    fresh = False
+    if check_compatibility:
+        code_sha = func.get('CodeSha256')
+        # Known-good code skips everything, including the cache lookup
+        compat_result = _known_good_result(known_good.get(code_sha), runtime, tools_available)
+        if compat_result:
+            log(f"  Known good from a previous run: {func_name}")
+        # Code is immutable per CodeSha256, so reuse results from previous runs
+        elif compat_result := load_cached_result(code_sha, tools_available):
+            log(f"  Using cached analysis for {func_name}")
+        else:
+            # Give each function its own directory; it is kept for the vermin pass
+            func_temp_dir = tempfile.mkdtemp(dir=temp_dir) if tools_available.get('vermin') else None
+            compat_result, code_path = analyze_function_compatibility(
+                func_name, lambda_client, func_temp_dir
+            )
+            fresh = compat_result['download_success']
+    
+    return compat_result, code_path, fresh
+
+@dataclass
+class FunctionReport:
+    """One CSV report row; fields are in CSV_HEADER column order"""
+    # Declared by hand rather than with dataclass(slots=True), which needs Python 3.10
+    __slots__ = (
+        'function_name', 'runtime', 'last_modified', 'cloudformation_managed', 'stack_name',
+        'compatibility_score', 'static_issues_count', 'static_issues', 'requirements_issues',
+        'recommendations', 'vermin_compatible', 'code_size_kb', 'memory_size_mb', 'timeout',
+        'function_arn'
+    )
+    function_name: str
+    runtime: str
+    last_modified: str
+    cloudformation_managed: str
+    stack_name: str
+    compatibility_score: str
+    static_issues_count: int
+    static_issues: str
+    requirements_issues: str
+    recommendations: str
+    vermin_compatible: object
+    code_size_kb: float
+    memory_size_mb: int
+    timeout: object
+    function_arn: str
+
+CSV_HEADER = [
+    'FunctionName', 'Runtime', 'LastModified', 'CloudFormationManaged', 'StackName',
+    'CompatibilityScore', 'StaticIssuesCount', 'StaticIssues', 'RequirementsIssues',
+    'Recommendations', 'VerminCompatible', 'CodeSize_KB', 'MemorySize_MB', 'Timeout',
+    'FunctionArn'
+]
+
+def build_report_row(func, is_cfn, stack_name, compat_result):
+    """Build the CSV report row for an analyzed function"""
+    # Convert sizes to readable formats
+    code_size_bytes = func.get('CodeSize', 0)
+    code_size_kb = round(code_size_bytes / 1024, 2) if code_size_bytes else 0
+    
+    return FunctionReport(
+        function_name=func['FunctionName'],
+        runtime=func.get('Runtime', 'N/A'),
+        last_modified=func.get('LastModified', 'N/A'),
+        cloudformation_managed='Yes' if is_cfn else 'No',
+        stack_name=stack_name if is_cfn else 'N/A',
+        compatibility_score=compat_result['compatibility_score'] if compat_result else 'NOT CHECKED',
+        static_issues_count=len(compat_result['static_issues']) if compat_result else 0,
+        static_issues=json.dumps(compat_result['static_issues']) if compat_result else '[]',
+        requirements_issues=json.dumps(compat_result['requirements_issues']) if compat_result else '[]',
+        recommendations='; '.join(compat_result['recommendations']) if compat_result else '',
+        vermin_compatible=compat_result['vermin_result']['compatible'] if compat_result and compat_result['vermin_result'] else 'N/A',
+        code_size_kb=code_size_kb,
+        memory_size_mb=func.get('MemorySize', 0),
+        timeout=func.get('Timeout', 'N/A'),
+        function_arn=func.get('FunctionArn', 'N/A')
+    )
+
+def analyze_lambda_runtimes(output_csv='lambda_compatibility_report.csv', region=None, check_compatibility=True, session=None):
     """Analyze Lambda functions and check Python 3.12 compatibility"""
     
-    if region:
-        lambda_client = boto3.client('lambda', region_name=region)
-    else:
-        lambda_client = boto3.client('lambda')
+    # One client (and connection pool) shared by every API call and worker thread
+    if session is None:
+        session = boto3.Session(region_name=region)
+    lambda_client = session.client('lambda', config=BOTO_CONFIG)
     
     print("\nRetrieving Lambda functions...")
-    functions = get_all_lambda_functions(region)
+    functions = get_all_lambda_functions(lambda_client)
     
     if not functions:
         print("No Lambda functions found in this region.")
@@ -292,76 +604,86 @@ def analyze_lambda_runtimes(output_csv='lambda_compatibility_report.csv', region
     }
     
     results = []
-    runtime_counts = defaultdict(int)
+    runtime_counts = Counter(func.get('Runtime', 'N/A') for func in functions)
+    
+    # CodeSha256s assessed LOW RISK by previous runs
+    known_good_file = known_good_path(output_csv)
+    known_good = load_known_good(known_good_file) if check_compatibility else {}
+    
+    # Only vermin needs code extracted to disk
+    temp_dir = tempfile.mkdtemp() if tools_available.get('vermin') else None
     
-    # Create temp directory for code downloads
-    temp_dir = tempfile.mkdtemp() if check_compatibility else None
+    # Collect Python 3.9 and below functions
+    candidates = [func for func in functions if func.get('Runtime') in STALE_PYTHON_RUNTIMES]
+    
+    stats['python_39_below'] = len(candidates)
     
     try:
-        for idx, func in enumerate(functions, 1):
-            runtime = func.get('Runtime', 'N/A')
-            func_name = func['FunctionName']
+        # Tag lookups are tiny requests, so they get a wider pool of their own and
+        # run alongside the heavier download/scan work instead of queueing behind it
+        with ThreadPoolExecutor(max_workers=API_MAX_WORKERS) as api_executor, \
+                ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            cfn_futures = {
+                func['FunctionName']: api_executor.submit(
+                    check_cloudformation_managed, func['FunctionName'], func['FunctionArn'], lambda_client
+                )
+                for func in candidates
+            }
+            futures = {
+                executor.submit(
+                    _analyze_one, func, idx, len(candidates), lambda_client,
+                    temp_dir, tools_available, check_compatibility, known_good
+                ): func
+                for idx, func in enumerate(candidates, 1)
+            }
+            analyses = []
+            for future in as_completed(futures):
+                func = futures[future]
+                is_cfn, stack_name = cfn_futures[func['FunctionName']].result()
+                analyses.append((func, is_cfn, stack_name, *future.result()))
+        
+        # Run vermin once over every downloaded function instead of once per function
+        vermin_results = {}
+        if tools_available.get('vermin'):
+            code_paths = [code_path for *_, code_path, _ in analyses if code_path]
+            if code_paths:
+                print(f"\nRunning vermin on {len(code_paths)} function(s)...")
+            vermin_results = run_vermin_batch(code_paths)
+        
+        for func, is_cfn, stack_name, compat_result, code_path, fresh in analyses:
+            if fresh:
+                # Freshly downloaded (not cached) - finish scoring and cache the result
+                compat_result['vermin_result'] = vermin_results.get(code_path)
+                score_compatibility(compat_result)
+                save_cached_result(func.get('CodeSha256'), tools_available, compat_result)
             
-            runtime_counts[runtime] += 1
+            results.append(build_report_row(func, is_cfn, stack_name, compat_result))
             
-            # Check if Python runtime 3.9 or below
-            if runtime.startswith('python'):
-                version = runtime.replace('python', '')
-                
-                try:
-                    version_float = float(version)
-                    if version_float <= 3.9:
-                        stats['python_39_below'] += 1
-                        print(f"\n[{idx}/{len(functions)}] Found: {func_name} ({runtime})")
-                        
-                        # Check if CloudFormation managed
-                        is_cfn, stack_name = check_cloudformation_managed(func_name, lambda_client)
-                        
-                        if is_cfn:
-                            stats['cloudformation_managed'] += 1
-                        else:
-                            stats['requires_manual_update'] += 1
-                        
-                        # Compatibility analysis
-                        compat_result = None
-                        if check_compatibility:
-                            compat_result = analyze_function_compatibility(
-                                func_name, lambda_client, temp_dir, tools_available
-                            )
-                            
-                            # Update risk stats
-                            if compat_result['compatibility_score'] == 'HIGH RISK':
-                                stats['high_risk'] += 1
-                            elif compat_result['compatibility_score'] == 'MEDIUM RISK':
-                                stats['medium_risk'] += 1
-                            elif compat_result['compatibility_score'] == 'LOW RISK':
-                                stats['low_risk'] += 1
-                        
-                        # Convert sizes to readable formats
-                        code_size_bytes = func.get('CodeSize', 0)
-                        code_size_kb = round(code_size_bytes / 1024, 2) if code_size_bytes else 0
-                        
-                        memory_size_mb = func.get('MemorySize', 0)
-                        
-                        results.append({
-                            'FunctionName': func_name,
-                            'Runtime': runtime,
-                            'LastModified': func.get('LastModified', 'N/A'),
-                            'CloudFormationManaged': 'Yes' if is_cfn else 'No',
-                            'StackName': stack_name if is_cfn else 'N/A',
-                            'CompatibilityScore': compat_result['compatibility_score'] if compat_result else 'NOT CHECKED',
-                            'StaticIssuesCount': len(compat_result['static_issues']) if compat_result else 0,
-                            'StaticIssues': json.dumps(compat_result['static_issues']) if compat_result else '[]',
-                            'RequirementsIssues': json.dumps(compat_result['requirements_issues']) if compat_result else '[]',
-                            'Recommendations': '; '.join(compat_result['recommendations']) if compat_result else '',
-                            'VerminCompatible': compat_result['vermin_result']['compatible'] if compat_result and compat_result['vermin_result'] else 'N/A',
-                            'CodeSize_KB': code_size_kb,
-                            'MemorySize_MB': memory_size_mb,
-                            'Timeout': func.get('Timeout', 'N/A'),
-                            'FunctionArn': func.get('FunctionArn', 'N/A')
-                        })
-                except ValueError:
-                    pass
+            if compat_result and compat_result['compatibility_score'] == 'LOW RISK' and func.get('CodeSha256'):
+                vermin_result = compat_result['vermin_result']
+                known_good[func['CodeSha256']] = {
+                    'score': 'LOW RISK',
+                    'runtime': func.get('Runtime'),
+                    'tool_version': TOOL_VERSION,
+                    'vermin_checked': bool(tools_available.get('vermin')),
+                    'vermin_result': {
+                        'compatible': vermin_result['compatible'],
+                        'min_version': vermin_result['min_version']
+                    } if vermin_result else None,
+                    'last_seen': datetime.now().isoformat(timespec='seconds')
+                }
+        
+        if check_compatibility:
+            save_known_good(known_good_file, known_good)
+        
+        cfn_counts = Counter(is_cfn for _, is_cfn, *_ in analyses)
+        stats['cloudformation_managed'] = cfn_counts[True]
+        stats['requires_manual_update'] = cfn_counts[False]
+        
+        risk_counts = Counter(row.compatibility_score for row in results)
+        stats['high_risk'] = risk_counts['HIGH RISK']
+        stats['medium_risk'] = risk_counts['MEDIUM RISK']
+        stats['low_risk'] = risk_counts['LOW RISK']
     finally:
         # Cleanup temp directory
         if temp_dir and os.path.exists(temp_dir):
@@ -369,7 +691,7 @@ def analyze_lambda_runtimes(output_csv='lambda_compatibility_report.csv', region
     
     # Sort results by risk level and function name
     risk_order = {'HIGH RISK': 0, 'MEDIUM RISK': 1, 'LOW RISK': 2, 'UNKNOWN': 3, 'NOT CHECKED': 4}
-    results.sort(key=lambda x: (risk_order.get(x['CompatibilityScore'], 99), x['FunctionName']))
+    results.sort(key=lambda r: (risk_order.get(r.compatibility_score, 99), r.function_name))
     
     # Print summary
     print("\n" + "="*70)
@@ -395,19 +717,19 @@ def analyze_lambda_runtimes(output_csv='lambda_compatibility_report.csv', region
     # Write to CSV
     if results:
         with open(output_csv, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=results[0].keys())
-            writer.writeheader()
-            writer.writerows(results)
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(astuple(result) for result in results)
         
         print(f"\nDetailed report saved to: {output_csv}")
         print(f"\nFunctions requiring update ({len(results)}):")
         print("-" * 90)
         
         for result in results:
-            cfn_status = "⚠️  CFN" if result['CloudFormationManaged'] == 'Yes' else "✓ Manual"
-            risk = result['CompatibilityScore']
+            cfn_status = "⚠️  CFN" if result.cloudformation_managed == 'Yes' else "✓ Manual"
+            risk = result.compatibility_score
             risk_icon = "🔴" if risk == "HIGH RISK" else "🟡" if risk == "MEDIUM RISK" else "🟢" if risk == "LOW RISK" else "⚪"
-            print(f"{cfn_status:10} | {risk_icon} {risk:12} | {result['Runtime']:12} | {result['FunctionName']}")
+            print(f"{cfn_status:10} | {risk_icon} {risk:12} | {result.runtime:12} | {result.function_name}")
     else:
         print("\n✓ No Lambda functions found using Python 3.9 or below!")
     
@@ -417,12 +739,14 @@ if __name__ == "__main__":
     print("Lambda Python 3.12 Compatibility Analyzer")
     print("="*70)
     
+    # Get region
+    region = os.environ.get('AWS_DEFAULT_REGION', os.environ.get('AWS_REGION'))
+    session = boto3.Session(region_name=region)
+    
     # Check AWS credentials first
-    if not check_aws_credentials():
+    if not check_aws_credentials(session):
         sys.exit(1)
     
-    # Get region
-    region = os.environ.get('AWS_DEFAULT_REGION', os.environ.get('AWS_REGION'))
     if region:
         print(f"  Region: {region}")
     else:
@@ -437,7 +761,7 @@ if __name__ == "__main__":
     print("="*70)
     
     try:
-        results, stats = analyze_lambda_runtimes(region=region, check_compatibility=check_compat)
+        results, stats = analyze_lambda_runtimes(region=region, check_compatibility=check_compat, session=session)
         
         if stats['python_39_below'] > 0:
             print("\n" + "="*70)
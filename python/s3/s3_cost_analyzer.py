@@ -7,20 +7,214 @@ Analyzes S3 buckets to identify cost-saving opportunities including:
 - Incomplete multipart uploads
 """
 
+import io
+import re
+import csv
+import codecs
+import gzip
 import json
+import os
+import time
 import boto3
 import argparse
+import shutil
+import tempfile
+import threading
 import subprocess
-from collections import defaultdict
-from botocore.exceptions import ClientError
-from datetime import datetime, timezone, timedelta
+from sys import intern
+from collections import Counter
+from heapq import heappush, heapreplace, nlargest
+from itertools import count, groupby
+from operator import itemgetter
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
+from urllib.parse import unquote
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from datetime import datetime, timezone
+
+MAX_WORKERS = 32  # buckets analyzed concurrently
+FANOUT_WORKERS = 32  # key-range listings / list_parts calls in flight, shared by all buckets
+LIST_PARTITIONS = 16  # key ranges a bucket's object walk is split into
+TOP_CANDIDATES = 20  # IA/Glacier candidates kept per bucket for the report
+SECONDS_PER_DAY = 86400
+
+# Fan-out keeps many requests in flight per client; keep-alive lets the
+# pooled connections be reused instead of paying a TLS handshake per call
+BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True
+)
+
+# Inventory reports must include these optional fields to replace a LIST walk
+INVENTORY_REQUIRED_FIELDS = ('Key', 'Size', 'LastModifiedDate', 'StorageClass')
+INVENTORY_PAGE_SIZE = 1000  # inventory rows handed to the aggregator at a time
+# Inventory files are large gzip objects; 16 MB ranged parts over several
+# connections get well past the throughput of a single GET stream
+INVENTORY_TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                           multipart_chunksize=16 * 1024 * 1024,
+                                           max_concurrency=10, use_threads=True)
+# Delivery folders are named like 2024-01-31T01-00Z
+INVENTORY_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}-\d{2}Z/$')
+
+# Lifecycle transitions that count as already covering the IA / Glacier candidates
+IA_TRANSITION_CLASSES = frozenset({'STANDARD_IA', 'ONEZONE_IA', 'INTELLIGENT_TIERING'})
+GLACIER_TRANSITION_CLASSES = frozenset({'GLACIER_IR', 'GLACIER', 'DEEP_ARCHIVE'})
+LIFECYCLE_CACHE_TTL = 24 * 3600  # seconds a bucket's lifecycle verdict is reused across runs
+
+# Shared by every bucket so nested fan-out can't multiply the thread count;
+# fan-out tasks use the per-thread clients from S3CostAnalyzer.get_thread_client
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS)
+
+_size_of = itemgetter('Size')
+
+
+def _keep_top(heap, entry):
+    """Add entry to a min-heap bounded at TOP_CANDIDATES, evicting the smallest"""
+    if len(heap) < TOP_CANDIDATES:
+        heappush(heap, entry)
+    else:
+        heapreplace(heap, entry)
+
+
+def _wait_all(futures, stop):
+    """Wait for every fan-out task of a bucket and re-raise the first failure.
+    
+    After a failure, queued tasks are cancelled and running ones are told to stop
+    through the `stop` event; all of them are waited for, so none is still
+    updating the analysis once this returns.
+    """
+    _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    if pending:
+        stop.set()
+        for future in pending:
+            future.cancel()
+        wait(pending)
+    for future in futures:
+        if not future.cancelled():
+            future.result()
+
+
+def _bucket_json(analysis):
+    """Return a bucket analysis in the report's JSON shape, with the Counters
+    folded back into by_storage_class / by_prefix {name: {'count', 'size_gb'}} maps"""
+    record = {}
+    for name, value in analysis.items():
+        if name == 'sc_count':
+            sc_size = analysis['sc_size']
+            record['by_storage_class'] = {sc: {'count': n, 'size_gb': sc_size[sc]} for sc, n in value.items()}
+        elif name == 'prefix_count':
+            prefix_size = analysis['prefix_size']
+            record['by_prefix'] = {prefix: {'count': n, 'size_gb': prefix_size[prefix]} for prefix, n in value.items()}
+        elif name not in ('sc_size', 'prefix_size'):
+            record[name] = value
+    return record
+
+
+def _render(write_section, *args):
+    """Return the text write_section(f, *args) writes, so it can be written in one call"""
+    with io.StringIO() as buf:
+        write_section(buf, *args)
+        return buf.getvalue()
+
+
+def _write_json_item(f, item):
+    """Append one compactly encoded list item per line; json only uses its C encoder
+    when indent is None"""
+    if f.tell():
+        f.write(',\n')
+    f.write(json.dumps(item, default=str))
+
+
+def _select_lines(payload):
+    """Yield the lines of an S3 Select CSV result as its record events stream in"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for event in payload:
+        if 'Records' in event:
+            pending += decoder.decode(event['Records']['Payload'])
+            *lines, pending = pending.split('\n')
+            yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def _key_ranges(prefixes, partitions=LIST_PARTITIONS):
+    """Split sorted top-level prefixes into at most `partitions` contiguous
+    (start, end) key ranges; end is None for the last range"""
+    n = min(partitions, len(prefixes))
+    starts = [prefixes[i * len(prefixes) // n] for i in range(n)]
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _key_before(prefix):
+    """Return a StartAfter value just below `prefix`, which ends with '/'.
+    
+    prefix[:-1] alone would also take in sibling prefixes like 'data-x/' or
+    'data.bak/', since '-' and '.' sort before '/'.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) - 1) + '\U0010ffff'
+
+
+def _prefix_of(obj):
+    """Return the folder part of an object's key, or 'root' for top-level keys"""
+    prefix, slash, _ = obj['Key'].rpartition('/')
+    return prefix if slash else 'root'
+
+def _applies_to_whole_bucket(rule):
+    """Return whether a lifecycle rule isn't scoped to a prefix or tags"""
+    scope = rule.get('Filter', {})
+    scope = scope.get('And', scope)
+    return not (rule.get('Prefix') or scope.get('Prefix') or scope.get('Tag') or scope.get('Tags'))
+
+
+def lifecycle_cache_path(output_file):
+    """Return the lifecycle verdict cache kept next to the report"""
+    return f"{os.path.splitext(output_file)[0]}_lifecycle_cache.json"
+
+
+def load_lifecycle_cache(path):
+    """Load {bucket: {'checked_at', 'optimized_by'}} from a previous run"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read lifecycle cache {path}: {e}")
+        return {}
+
+
+def save_lifecycle_cache(path, cache):
+    """Write the lifecycle verdicts, replacing the file atomically"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Warning: Could not write lifecycle cache {path}: {e}")
 
 
 class S3CostAnalyzer:
-    def __init__(self, region_name=None):
-        self.s3_client = boto3.client('s3', region_name=region_name)
-        self.s3_resource = boto3.resource('s3', region_name=region_name)
+    def __init__(self, region_name=None, use_inventory=False, inventory_bucket=None, inventory_prefix='',
+                 skip_optimized=False, lifecycle_cache=None):
+        self.region_name = region_name
+        # Skip the object walk for buckets whose lifecycle rules already do the transitions
+        self.skip_optimized = skip_optimized
+        self.lifecycle_cache = lifecycle_cache if lifecycle_cache is not None else {}
+        # Inventory mode: read S3 Inventory reports instead of listing buckets
+        self.use_inventory = use_inventory or bool(inventory_bucket)
+        self.inventory_bucket = inventory_bucket
+        self.inventory_prefix = inventory_prefix.strip('/')
+        # Cleared the first time S3 Select is refused (it's closed to new accounts)
+        self._select_available = True
+        self.s3_client = boto3.client('s3', region_name=region_name, config=BOTO_CONFIG)
         self.profile = "tss-sso"
+        # boto3 sessions aren't thread-safe, so each worker gets its own client
+        self._thread_local = threading.local()
 
         
         # Storage class pricing (approximate USD per GB per month)
@@ -33,18 +227,18 @@ class S3CostAnalyzer:
             'GLACIER': 0.0036,
             'DEEP_ARCHIVE': 0.00099
         }
+        # Monthly savings per GB of moving an object from a class to IA / Glacier
+        self.ia_delta = self.pricing['STANDARD'] - self.pricing['STANDARD_IA']
+        self.glacier_delta = {sc: price - self.pricing['GLACIER'] for sc, price in self.pricing.items()}
 
     def is_sso_session_valid(self) -> bool:
         """Return True if the AWS SSO session is still valid."""
+        # Same check as `aws sts get-caller-identity --profile ...`, without forking the CLI
         try:
-            subprocess.run(
-                ["aws", "sts", "get-caller-identity", "--profile", self.profile],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
+            sts = boto3.session.Session(profile_name=self.profile).client('sts')
+            sts.get_caller_identity()
             return True
-        except subprocess.CalledProcessError:
+        except (BotoCoreError, ClientError):
             return False
 
     def login_sso(self):
@@ -53,6 +247,13 @@ class S3CostAnalyzer:
         subprocess.run(["aws", "sso", "login", "--profile", self.profile], check=True)
         print("✅ Login successful.")
 
+    def get_thread_client(self):
+        """Return an S3 client owned by the calling thread"""
+        local = self._thread_local
+        if not hasattr(local, 's3_client'):
+            local.s3_client = boto3.session.Session().client('s3', region_name=self.region_name, config=BOTO_CONFIG)
+        return local.s3_client
+
     def get_all_buckets(self):
         """Retrieve all S3 buckets"""
         try:
@@ -62,144 +263,468 @@ class S3CostAnalyzer:
             print(f"Error listing buckets: {e}")
             return []
     
+    def _archive_tiering_days(self, bucket_name):
+        """Return the fewest days after which a bucket-wide Intelligent-Tiering
+        configuration archives objects, or None"""
+        try:
+            response = self.get_thread_client().list_bucket_intelligent_tiering_configurations(Bucket=bucket_name)
+        except ClientError:
+            return None
+        return min((tiering['Days']
+                    for config in response.get('IntelligentTieringConfigurationList', [])
+                    if config.get('Status') == 'Enabled' and not config.get('Filter')
+                    for tiering in config.get('Tierings', [])), default=None)
+
+    def optimizing_lifecycle_rule(self, bucket_name):
+        """Return a description of the lifecycle rule that already moves the whole bucket
+        to IA within 30 days and Glacier within 180 days, or None.
+        
+        Answers are kept in self.lifecycle_cache for LIFECYCLE_CACHE_TTL seconds.
+        """
+        now_ts = time.time()
+        cached = self.lifecycle_cache.get(bucket_name)
+        if cached and now_ts - cached['checked_at'] < LIFECYCLE_CACHE_TTL:
+            return cached['optimized_by']
+        
+        try:
+            rules = self.get_thread_client().get_bucket_lifecycle_configuration(Bucket=bucket_name)['Rules']
+        except ClientError:
+            # NoSuchLifecycleConfiguration, or not allowed to read it
+            rules = []
+        
+        optimized_by = None
+        for rule in rules:
+            if rule.get('Status') != 'Enabled' or not _applies_to_whole_bucket(rule):
+                continue
+            days = {}
+            for transition in rule.get('Transitions', []):
+                if 'Days' in transition:
+                    storage_class = transition['StorageClass']
+                    days[storage_class] = min(transition['Days'], days.get(storage_class, transition['Days']))
+            
+            ia_days = min((d for sc, d in days.items() if sc in IA_TRANSITION_CLASSES or sc in GLACIER_TRANSITION_CLASSES),
+                          default=None)
+            glacier_days = min((d for sc, d in days.items() if sc in GLACIER_TRANSITION_CLASSES), default=None)
+            # Intelligent-Tiering reaches the archive tiers through its own configuration
+            if glacier_days is None and 'INTELLIGENT_TIERING' in days:
+                glacier_days = self._archive_tiering_days(bucket_name)
+            
+            if ia_days is not None and ia_days <= 30 and glacier_days is not None and glacier_days <= 180:
+                optimized_by = f"lifecycle rule '{rule.get('ID', '')}'"
+                break
+        
+        self.lifecycle_cache[bucket_name] = {'checked_at': now_ts, 'optimized_by': optimized_by}
+        return optimized_by
+
+    def list_object_pages(self, bucket_name, prefix='', delimiter=None, start_after=None):
+        """Yield (Contents, CommonPrefixes) for each list_objects_v2 page"""
+        s3_client = self.get_thread_client()
+        paginator = s3_client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': bucket_name, 'Prefix': prefix, 'PaginationConfig': {'PageSize': 1000}}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        if start_after:
+            kwargs['StartAfter'] = start_after
+        for page in paginator.paginate(**kwargs):
+            yield page.get('Contents', []), page.get('CommonPrefixes', [])
+
+    def _latest_delivery(self, dest_bucket, config_prefix):
+        """Return the newest dated delivery prefix under an inventory config, or None"""
+        try:
+            deliveries = [
+                cp['Prefix']
+                for _, common_prefixes in self.list_object_pages(dest_bucket, prefix=config_prefix, delimiter='/')
+                for cp in common_prefixes
+                if INVENTORY_DATE_RE.search(cp['Prefix'])
+            ]
+        except ClientError:
+            # Destination bucket not readable (e.g. AccessDenied)
+            return None
+        return max(deliveries) if deliveries else None
+
+    def find_inventory_manifest(self, bucket_name):
+        """Return (bucket, key) of the newest CSV inventory manifest for a bucket, or None"""
+        s3_client = self.get_thread_client()
+        # (destination bucket, "<prefix>/<source bucket>/<config id>/") candidates
+        config_prefixes = []
+        
+        if self.inventory_bucket:
+            # Explicit destination: every config folder delivered for this bucket
+            base = f"{self.inventory_prefix}/{bucket_name}/".lstrip('/')
+            try:
+                for _, common_prefixes in self.list_object_pages(self.inventory_bucket, prefix=base, delimiter='/'):
+                    config_prefixes.extend((self.inventory_bucket, cp['Prefix']) for cp in common_prefixes)
+            except ClientError:
+                return None
+        else:
+            try:
+                response = s3_client.list_bucket_inventory_configurations(Bucket=bucket_name)
+            except ClientError:
+                return None
+            for config in response.get('InventoryConfigurationList', []):
+                destination = config['Destination']['S3BucketDestination']
+                if not config.get('IsEnabled') or destination.get('Format') != 'CSV':
+                    continue
+                dest_bucket = destination['Bucket'].split(':::')[-1]
+                prefix = destination.get('Prefix', '').strip('/')
+                config_prefixes.append((dest_bucket, f"{prefix}/{bucket_name}/{config['Id']}/".lstrip('/')))
+        
+        manifests = []
+        for dest_bucket, config_prefix in config_prefixes:
+            delivery = self._latest_delivery(dest_bucket, config_prefix)
+            if delivery:
+                manifests.append((delivery, dest_bucket))
+        if not manifests:
+            return None
+        
+        # Delivery folders sort chronologically by name
+        delivery, dest_bucket = max(manifests, key=lambda m: m[0].rsplit('/', 2)[-2])
+        return dest_bucket, delivery + 'manifest.json'
+
+    def inventory_files(self, manifest_bucket, manifest_key):
+        """Return (data bucket, file keys, columns) of a CSV inventory report.
+        
+        Returns None if the manifest can't be read or the report lacks a required field.
+        """
+        s3_client = self.get_thread_client()
+        try:
+            manifest = json.loads(s3_client.get_object(Bucket=manifest_bucket, Key=manifest_key)['Body'].read())
+        except ClientError:
+            return None
+        columns = [name.strip() for name in manifest['fileSchema'].split(',')]
+        if manifest.get('fileFormat') != 'CSV' or not all(f in columns for f in INVENTORY_REQUIRED_FIELDS):
+            return None
+        return (manifest['destinationBucket'].split(':::')[-1],
+                [f['key'] for f in manifest['files']], columns)
+
+    def _select_inventory_rows(self, data_bucket, key, columns):
+        """Return (Key, Size, LastModifiedDate, StorageClass) rows of current objects in
+        one inventory file, with the projection and version filter done by S3 Select.
+        
+        Returns None if S3 Select can't be used on the file.
+        """
+        fields = ', '.join(f"s._{columns.index(name) + 1}" for name in INVENTORY_REQUIRED_FIELDS)
+        # Versioned inventories list every version; only current objects count, as with LIST
+        conditions = []
+        if 'IsLatest' in columns:
+            conditions.append(f"s._{columns.index('IsLatest') + 1} = 'true'")
+        if 'IsDeleteMarker' in columns:
+            conditions.append(f"s._{columns.index('IsDeleteMarker') + 1} <> 'true'")
+        expression = f"SELECT {fields} FROM S3Object s"
+        if conditions:
+            expression += " WHERE " + " AND ".join(conditions)
+        
+        try:
+            response = self.get_thread_client().select_object_content(
+                Bucket=data_bucket,
+                Key=key,
+                ExpressionType='SQL',
+                Expression=expression,
+                InputSerialization={'CSV': {'FileHeaderInfo': 'NONE'}, 'CompressionType': 'GZIP'},
+                OutputSerialization={'CSV': {}}
+            )
+        except ClientError:
+            return None
+        return csv.reader(_select_lines(response['Payload']))
+
+    def _download_inventory_rows(self, data_bucket, key, columns):
+        """Yield the same rows as _select_inventory_rows from a full download of the file"""
+        key_col, size_col, modified_col, class_col = (columns.index(name) for name in INVENTORY_REQUIRED_FIELDS)
+        latest_col = columns.index('IsLatest') if 'IsLatest' in columns else None
+        marker_col = columns.index('IsDeleteMarker') if 'IsDeleteMarker' in columns else None
+        
+        # Ranged parts over several connections, spooled to disk since gzip reads the file in order
+        with tempfile.TemporaryFile() as compressed:
+            self.get_thread_client().download_fileobj(data_bucket, key, compressed, Config=INVENTORY_TRANSFER_CONFIG)
+            compressed.seek(0)
+            with gzip.open(compressed, 'rt', newline='') as rows:
+                for row in csv.reader(rows):
+                    if latest_col is not None and row[latest_col] != 'true':
+                        continue
+                    if marker_col is not None and row[marker_col] == 'true':
+                        continue
+                    yield row[key_col], row[size_col], row[modified_col], row[class_col]
+
+    def inventory_object_pages(self, data_bucket, key, columns):
+        """Yield lists of list_objects_v2-shaped dicts read from one gzipped CSV inventory file"""
+        rows = None
+        # Inventories carry many unused columns, so let S3 project them away
+        # when the account still has S3 Select
+        if self._select_available:
+            rows = self._select_inventory_rows(data_bucket, key, columns)
+            if rows is None:
+                self._select_available = False
+        if rows is None:
+            rows = self._download_inventory_rows(data_bucket, key, columns)
+        
+        page = []
+        for object_key, size, last_modified, storage_class in rows:
+            page.append({
+                # Inventory keys are URL-encoded
+                'Key': unquote(object_key),
+                'Size': int(size or 0),
+                'LastModified': datetime.fromisoformat(last_modified.replace('Z', '+00:00')),
+                'StorageClass': storage_class,
+            })
+            if len(page) >= INVENTORY_PAGE_SIZE:
+                yield page
+                page = []
+        if page:
+            yield page
+
     def analyze_bucket_objects(self, bucket_name, days_threshold=90):
         """Analyze objects in a bucket for cost optimization"""
         print(f"Analyzing bucket: {bucket_name}...")
         
-        bucket = self.s3_resource.Bucket(bucket_name)
         analysis = {
             'bucket_name': bucket_name,
+            'source': 'list',
             'total_objects': 0,
             'total_size_gb': 0,
-            'by_storage_class': defaultdict(lambda: {'count': 0, 'size_gb': 0}),
-            'old_objects': [],
+            # Object counts and sizes in GB per storage class and per folder
+            # (the key up to its last '/'); written to JSON as by_storage_class
+            # and by_prefix
+            'sc_count': Counter(),
+            'sc_size': Counter(),
+            'old_objects_count': 0,
+            'old_objects_size_gb': 0,
+            # Only the top TOP_CANDIDATES of each are kept, plus running totals
             'candidates_for_ia': [],
+            'candidates_for_ia_count': 0,
+            'candidates_for_ia_savings': 0,
             'candidates_for_glacier': [],
-            'by_prefix': defaultdict(lambda: {'count': 0, 'size_gb': 0}),
+            'candidates_for_glacier_count': 0,
+            'candidates_for_glacier_savings': 0,
+            'prefix_count': Counter(),
+            'prefix_size': Counter(),
         }
         
-        now = datetime.now(timezone.utc)
-        threshold_date = now - timedelta(days=days_threshold)
-        ia_threshold = now - timedelta(days=30)  # Objects older than 30 days for IA
-        glacier_threshold = now - timedelta(days=180)  # Objects older than 180 days for Glacier
+        if self.skip_optimized:
+            optimized_by = self.optimizing_lifecycle_rule(bucket_name)
+            if optimized_by:
+                print(f"Skipping {bucket_name}: {optimized_by} already transitions objects to IA and Glacier")
+                analysis['already_optimized'] = optimized_by
+                return analysis
         
-        try:
-
-            if self.is_sso_session_valid():
-                print(f"✅ AWS SSO session for profile '{self.profile}' is still valid.")
-            else:
-                print(f"⚠️  AWS SSO session for profile '{self.profile}' has expired.")
-                self.login_sso()
-
-            for obj in bucket.objects.all():
-                size_gb = obj.size / (1024**3)
-                storage_class = obj.storage_class if obj.storage_class else 'STANDARD'
-                
-                analysis['total_objects'] += 1
-                analysis['total_size_gb'] += size_gb
-                analysis['by_storage_class'][storage_class]['count'] += 1
-                analysis['by_storage_class'][storage_class]['size_gb'] += size_gb
-                
-                # Analyze by prefix (folder)
-                prefix = '/'.join(obj.key.split('/')[:-1]) if '/' in obj.key else 'root'
-                analysis['by_prefix'][prefix]['count'] += 1
-                analysis['by_prefix'][prefix]['size_gb'] += size_gb
+        # Ages are compared as epoch seconds, which avoids a timedelta per object
+        now_ts = datetime.now(timezone.utc).timestamp()
+        threshold_ts = now_ts - days_threshold * SECONDS_PER_DAY
+        ia_threshold_ts = now_ts - 30 * SECONDS_PER_DAY  # Objects older than 30 days for IA
+        glacier_threshold_ts = now_ts - 180 * SECONDS_PER_DAY  # Objects older than 180 days for Glacier
+        # Objects modified after this are too recent for any of the checks
+        recent_cutoff_ts = max(threshold_ts, ia_threshold_ts, glacier_threshold_ts)
+        
+        # Hoisted out of the per-object loop
+        inv_gb = 1.0 / (1024**3)
+        min_ia_size = 128 * 1024  # Min size for IA
+        ia_delta = self.ia_delta
+        glacier_delta = self.glacier_delta
+        sc_count = analysis['sc_count']
+        sc_size = analysis['sc_size']
+        prefix_count = analysis['prefix_count']
+        prefix_size = analysis['prefix_size']
+        
+        # Min-heaps of (score, seq, record) holding the largest candidates seen so far;
+        # seq breaks ties so records are never compared
+        top_ia = []
+        top_glacier = []
+        seq = count()
+        
+        # Key ranges / inventory files are read on other threads, so updates are
+        # serialized; `stop` ends the other reads early once one has failed
+        lock = threading.Lock()
+        stop = threading.Event()
+        
+        def accumulate(objects):
+            with lock:
+                # Whole-page totals are summed in C rather than per object
+                analysis['total_objects'] += len(objects)
+                analysis['total_size_gb'] += sum(map(_size_of, objects)) * inv_gb
                 
-                # Find old objects
-                if obj.last_modified < threshold_date:
-                    analysis['old_objects'].append({
-                        'key': obj.key,
-                        'size_gb': size_gb,
-                        'last_modified': obj.last_modified.isoformat(),
-                        'storage_class': storage_class,
-                        'age_days': (now - obj.last_modified).days
-                    })
+                # Analyze by prefix (folder). Adjacent objects with the same prefix
+                # are folded in with one update per run. A prefix can appear in
+                # several runs (LIST order splits a/b/1, a/b/c/2, a/b/z, and
+                # inventory files aren't sorted), so every run adds to the Counters
+                for prefix, run in groupby(objects, key=_prefix_of):
+                    run_sizes = list(map(_size_of, run))
+                    # Every page brings fresh copies of the same few strings;
+                    # interned keys hit the identity fast path in dict lookups
+                    prefix = intern(prefix)
+                    prefix_count[prefix] += len(run_sizes)
+                    prefix_size[prefix] += sum(run_sizes) * inv_gb
                 
-                # Candidates for Intelligent-Tiering or Standard-IA
-                if (storage_class == 'STANDARD' and 
-                    obj.last_modified < ia_threshold and 
-                    obj.size > 128 * 1024):  # Min size for IA
-                    analysis['candidates_for_ia'].append({
-                        'key': obj.key,
-                        'size_gb': size_gb,
-                        'last_modified': obj.last_modified.isoformat(),
-                        'age_days': (now - obj.last_modified).days,
-                        'potential_savings_monthly': size_gb * (self.pricing['STANDARD'] - self.pricing['STANDARD_IA'])
-                    })
+                for obj in objects:
+                    size = obj['Size']
+                    size_gb = size * inv_gb
+                    storage_class = intern(obj.get('StorageClass') or 'STANDARD')
+                    sc_count[storage_class] += 1
+                    sc_size[storage_class] += size_gb
+                    
+                    last_modified = obj['LastModified']
+                    modified_ts = last_modified.timestamp()
+                    if modified_ts >= recent_cutoff_ts:
+                        continue
+                    age_days = int((now_ts - modified_ts) // SECONDS_PER_DAY)
+                    
+                    # Find old objects
+                    if modified_ts < threshold_ts:
+                        analysis['old_objects_count'] += 1
+                        analysis['old_objects_size_gb'] += size_gb
+                    
+                    # Candidates for Intelligent-Tiering or Standard-IA, ranked by size
+                    if (storage_class == 'STANDARD' and 
+                        modified_ts < ia_threshold_ts and 
+                        size > min_ia_size):
+                        savings = size_gb * ia_delta
+                        analysis['candidates_for_ia_count'] += 1
+                        analysis['candidates_for_ia_savings'] += savings
+                        if len(top_ia) < TOP_CANDIDATES or size_gb > top_ia[0][0]:
+                            _keep_top(top_ia, (size_gb, next(seq), {
+                                'key': obj['Key'],
+                                'size_gb': size_gb,
+                                'last_modified': last_modified.isoformat(),
+                                'age_days': age_days,
+                                'potential_savings_monthly': savings
+                            }))
+                    
+                    # Candidates for Glacier, ranked by savings
+                    if (storage_class in ('STANDARD', 'STANDARD_IA') and 
+                        modified_ts < glacier_threshold_ts):
+                        savings = size_gb * glacier_delta[storage_class]
+                        analysis['candidates_for_glacier_count'] += 1
+                        analysis['candidates_for_glacier_savings'] += savings
+                        if len(top_glacier) < TOP_CANDIDATES or savings > top_glacier[0][0]:
+                            _keep_top(top_glacier, (savings, next(seq), {
+                                'key': obj['Key'],
+                                'size_gb': size_gb,
+                                'last_modified': last_modified.isoformat(),
+                                'age_days': age_days,
+                                'current_storage_class': storage_class,
+                                'potential_savings_monthly': savings
+                            }))
+        
+        def list_range(start, end):
+            # Keys under one top-level prefix are contiguous, so a range of
+            # prefixes is one flat walk from just below `start` up to `end`
+            for contents, _ in self.list_object_pages(bucket_name, start_after=_key_before(start)):
+                if stop.is_set():
+                    return
+                # Root-level objects were already counted by the delimited listing
+                accumulate([obj for obj in contents
+                            if start <= obj['Key'] and (end is None or obj['Key'] < end) and '/' in obj['Key']])
+                if end is not None and contents and contents[-1]['Key'] >= end:
+                    return
+        
+        def read_inventory_file(data_bucket, key, columns):
+            for page in self.inventory_object_pages(data_bucket, key, columns):
+                if stop.is_set():
+                    return
+                accumulate(page)
+        
+        try:
+            inventory = None
+            if self.use_inventory:
+                manifest = self.find_inventory_manifest(bucket_name)
+                if manifest:
+                    inventory = self.inventory_files(*manifest)
+                if inventory is None:
+                    print(f"No usable CSV inventory for {bucket_name}, listing objects instead")
+            
+            if inventory is not None:
+                print(f"Reading inventory for {bucket_name} from s3://{manifest[0]}/{manifest[1]}")
+                analysis['source'] = 'inventory'
+                # Inventory files are independent, so fetch them concurrently
+                data_bucket, keys, columns = inventory
+                _wait_all([_fanout_executor.submit(read_inventory_file, data_bucket, key, columns)
+                           for key in keys], stop)
+            else:
+                # The first, delimited listing returns root-level objects plus the
+                # top-level prefixes. Those are grouped into a bounded number of
+                # key ranges listed in parallel, so the LIST count stays close to
+                # a flat walk's however many prefixes the bucket has
+                prefixes = []
+                for contents, common_prefixes in self.list_object_pages(bucket_name, delimiter='/'):
+                    accumulate(contents)
+                    prefixes.extend(cp['Prefix'] for cp in common_prefixes)
                 
-                # Candidates for Glacier
-                if (storage_class in ['STANDARD', 'STANDARD_IA'] and 
-                    obj.last_modified < glacier_threshold):
-                    current_cost = self.pricing.get(storage_class, self.pricing['STANDARD'])
-                    analysis['candidates_for_glacier'].append({
-                        'key': obj.key,
-                        'size_gb': size_gb,
-                        'last_modified': obj.last_modified.isoformat(),
-                        'age_days': (now - obj.last_modified).days,
-                        'current_storage_class': storage_class,
-                        'potential_savings_monthly': size_gb * (current_cost - self.pricing['GLACIER'])
-                    })
+                _wait_all([_fanout_executor.submit(list_range, start, end)
+                           for start, end in _key_ranges(prefixes)], stop)
         
         except ClientError as e:
             print(f"Error accessing bucket {bucket_name}: {e}")
             analysis['error'] = str(e)
         
+        # Largest first, as the report lists them
+        analysis['candidates_for_ia'] = [record for *_, record in sorted(top_ia, reverse=True)]
+        analysis['candidates_for_glacier'] = [record for *_, record in sorted(top_glacier, reverse=True)]
         return analysis
     
-    def analyze_multipart_uploads(self, bucket_name, days_threshold=7):
-        """Analyze incomplete multipart uploads"""
+    def analyze_multipart_uploads(self, bucket_name, days_threshold=7, fast=False):
+        """Analyze incomplete multipart uploads.
+        
+        With fast=True, parts are not listed and stale uploads are reported without sizes.
+        """
         print(f"Analyzing multipart uploads for bucket: {bucket_name}...")
         
         multipart_analysis = {
             'bucket_name': bucket_name,
             'total_uploads': 0,
             'old_uploads': [],
-            'estimated_storage_gb': 0
+            'estimated_storage_gb': 0,
+            'sizes_measured': not fast
         }
         
-        now = datetime.now(timezone.utc)
-        threshold_date = now - timedelta(days=days_threshold)
+        now_ts = datetime.now(timezone.utc).timestamp()
+        threshold_ts = now_ts - days_threshold * SECONDS_PER_DAY
+        
+        s3_client = self.get_thread_client()
+        
+        def upload_size_gb(upload):
+            """Sum an upload's parts on a fan-out thread; None if they can't be listed"""
+            # list_parts returns at most 1000 parts per call, so page through them all
+            paginator = self.get_thread_client().get_paginator('list_parts')
+            try:
+                total_size = sum(
+                    part['Size']
+                    for page in paginator.paginate(Bucket=bucket_name, Key=upload['Key'],
+                                                   UploadId=upload['UploadId'])
+                    for part in page.get('Parts', [])
+                )
+            except ClientError:
+                return None
+            return total_size / (1024**3)
         
         try:
-            paginator = self.s3_client.get_paginator('list_multipart_uploads')
+            paginator = s3_client.get_paginator('list_multipart_uploads')
             pages = paginator.paginate(Bucket=bucket_name)
             
+            old_uploads = []
             for page in pages:
                 if 'Uploads' in page:
                     for upload in page['Uploads']:
                         multipart_analysis['total_uploads'] += 1
-                        initiated = upload['Initiated']
+                        initiated_ts = upload['Initiated'].timestamp()
                         
-                        if initiated < threshold_date:
-                            # Get parts to estimate size
-                            try:
-                                parts_response = self.s3_client.list_parts(
-                                    Bucket=bucket_name,
-                                    Key=upload['Key'],
-                                    UploadId=upload['UploadId']
-                                )
-                                
-                                total_size = sum(part['Size'] for part in parts_response.get('Parts', []))
-                                size_gb = total_size / (1024**3)
-                                
-                                multipart_analysis['old_uploads'].append({
-                                    'key': upload['Key'],
-                                    'upload_id': upload['UploadId'],
-                                    'initiated': initiated.isoformat(),
-                                    'age_days': (now - initiated).days,
-                                    'size_gb': size_gb
-                                })
-                                
-                                multipart_analysis['estimated_storage_gb'] += size_gb
-                            except ClientError:
-                                # If we can't list parts, just note the upload without size
-                                multipart_analysis['old_uploads'].append({
-                                    'key': upload['Key'],
-                                    'upload_id': upload['UploadId'],
-                                    'initiated': initiated.isoformat(),
-                                    'age_days': (now - initiated).days,
-                                    'size_gb': 0  # Unknown size
-                                })
+                        if initiated_ts < threshold_ts:
+                            age_days = int((now_ts - initiated_ts) // SECONDS_PER_DAY)
+                            old_uploads.append((upload, age_days))
+            
+            # Get parts to estimate sizes, one list_parts walk per upload in parallel
+            if fast:
+                sizes = [None] * len(old_uploads)
+            else:
+                sizes = _fanout_executor.map(upload_size_gb, [upload for upload, _ in old_uploads])
+            for (upload, age_days), size_gb in zip(old_uploads, sizes):
+                multipart_analysis['old_uploads'].append({
+                    'key': upload['Key'],
+                    'upload_id': upload['UploadId'],
+                    'initiated': upload['Initiated'].isoformat(),
+                    'age_days': age_days,
+                    # If we can't list parts, just note the upload without size
+                    'size_gb': size_gb or 0
+                })
+                if size_gb:
+                    multipart_analysis['estimated_storage_gb'] += size_gb
         
         except ClientError as e:
             print(f"Error analyzing multipart uploads for {bucket_name}: {e}")
@@ -207,181 +732,227 @@ class S3CostAnalyzer:
         
         return multipart_analysis
     
-    def generate_report(self, bucket_analyses, multipart_analyses, output_file='s3_cost_report.txt'):
-        """Generate a comprehensive cost optimization report"""
-        with open(output_file, 'w') as f:
-            f.write("=" * 80 + "\n")
-            f.write("S3 COST OPTIMIZATION REPORT\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 80 + "\n\n")
-            
-            # Summary across all buckets
-            total_size = sum(a['total_size_gb'] for a in bucket_analyses)
-            total_objects = sum(a['total_objects'] for a in bucket_analyses)
-            total_ia_savings = sum(
-                sum(obj['potential_savings_monthly'] for obj in a['candidates_for_ia'])
-                for a in bucket_analyses
-            )
-            total_glacier_savings = sum(
-                sum(obj['potential_savings_monthly'] for obj in a['candidates_for_glacier'])
-                for a in bucket_analyses
-            )
-            total_multipart_storage = sum(m['estimated_storage_gb'] for m in multipart_analyses)
-            
-            f.write("EXECUTIVE SUMMARY\n")
-            f.write("-" * 80 + "\n")
-            f.write(f"Total Buckets Analyzed: {len(bucket_analyses)}\n")
-            f.write(f"Total Objects: {total_objects:,}\n")
-            f.write(f"Total Storage: {total_size:.2f} GB\n")
-            f.write(f"Potential Monthly Savings (IA Migration): ${total_ia_savings:.2f}\n")
-            f.write(f"Potential Monthly Savings (Glacier Migration): ${total_glacier_savings:.2f}\n")
+    def write_report_header(self, f):
+        """Write the report title"""
+        f.write("=" * 80 + "\n")
+        f.write("S3 COST OPTIMIZATION REPORT\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("=" * 80 + "\n\n")
+
+    def write_summary(self, f, totals, multipart_measured):
+        """Write the executive summary from the running totals"""
+        f.write("EXECUTIVE SUMMARY\n")
+        f.write("-" * 80 + "\n")
+        skipped = totals['skipped_optimized_buckets']
+        # Skipped buckets aren't walked, so their objects are missing from the totals
+        scope = f" (excluding {skipped} skipped bucket(s))" if skipped else ""
+        f.write(f"Total Buckets Analyzed: {totals['total_buckets'] - skipped}\n")
+        if skipped:
+            f.write(f"Buckets Skipped (lifecycle already optimized): {skipped}\n")
+        f.write(f"Total Objects{scope}: {totals['total_objects']:,}\n")
+        f.write(f"Total Storage{scope}: {totals['total_size_gb']:.2f} GB\n")
+        f.write(f"Potential Monthly Savings (IA Migration): ${totals['potential_ia_savings_monthly']:.2f}\n")
+        f.write(f"Potential Monthly Savings (Glacier Migration): ${totals['potential_glacier_savings_monthly']:.2f}\n")
+        if multipart_measured:
+            total_multipart_storage = totals['multipart_storage_gb']
             f.write(f"Storage in Incomplete Multipart Uploads: {total_multipart_storage:.2f} GB\n")
             f.write(f"Estimated Monthly Cost of Multipart Storage: ${total_multipart_storage * self.pricing['STANDARD']:.2f}\n")
-            f.write("\n\n")
+        else:
+            f.write("Storage in Incomplete Multipart Uploads: not measured (--fast-multipart)\n")
+        f.write("\n\n")
+
+    def write_bucket_section(self, f, analysis):
+        """Write the report section for one bucket"""
+        f.write("=" * 80 + "\n")
+        f.write(f"BUCKET: {analysis['bucket_name']}\n")
+        f.write("=" * 80 + "\n\n")
+        
+        if 'error' in analysis:
+            f.write(f"ERROR: {analysis['error']}\n\n")
+            return
+        
+        if 'already_optimized' in analysis:
+            f.write(f"SKIPPED: {analysis['already_optimized']} already transitions objects "
+                    f"to IA within 30 days and Glacier within 180 days\n\n")
+            return
+        
+        f.write(f"Total Objects: {analysis['total_objects']:,}\n")
+        f.write(f"Total Size: {analysis['total_size_gb']:.2f} GB\n\n")
+        
+        # Storage class breakdown
+        f.write("STORAGE CLASS DISTRIBUTION\n")
+        f.write("-" * 80 + "\n")
+        sc_size = analysis['sc_size']
+        for storage_class, object_count in sorted(analysis['sc_count'].items()):
+            size_gb = sc_size[storage_class]
+            monthly_cost = size_gb * self.pricing.get(storage_class, 0.023)
+            f.write(f"{storage_class:20s}: {object_count:>8,} objects, "
+                   f"{size_gb:>10.2f} GB, ${monthly_cost:>8.2f}/month\n")
+        f.write("\n")
+        
+        # Top prefixes (folders)
+        f.write("TOP 10 PREFIXES BY SIZE\n")
+        f.write("-" * 80 + "\n")
+        prefix_count = analysis['prefix_count']
+        for prefix, size_gb in analysis['prefix_size'].most_common(10):
+            f.write(f"{prefix[:60]:60s}: {prefix_count[prefix]:>8,} objects, {size_gb:>10.2f} GB\n")
+        f.write("\n")
+        
+        # Candidates for Standard-IA
+        if analysis['candidates_for_ia']:
+            f.write("CANDIDATES FOR STANDARD-IA (Top 20 by size)\n")
+            f.write("-" * 80 + "\n")
+            f.write(f"Total candidates: {analysis['candidates_for_ia_count']}\n")
+            f.write(f"Potential monthly savings: ${analysis['candidates_for_ia_savings']:.2f}\n\n")
             
-            # Per-bucket analysis
-            for analysis in bucket_analyses:
-                f.write("=" * 80 + "\n")
-                f.write(f"BUCKET: {analysis['bucket_name']}\n")
-                f.write("=" * 80 + "\n\n")
-                
-                if 'error' in analysis:
-                    f.write(f"ERROR: {analysis['error']}\n\n")
-                    continue
-                
-                f.write(f"Total Objects: {analysis['total_objects']:,}\n")
-                f.write(f"Total Size: {analysis['total_size_gb']:.2f} GB\n\n")
-                
-                # Storage class breakdown
-                f.write("STORAGE CLASS DISTRIBUTION\n")
-                f.write("-" * 80 + "\n")
-                for storage_class, data in sorted(analysis['by_storage_class'].items()):
-                    monthly_cost = data['size_gb'] * self.pricing.get(storage_class, 0.023)
-                    f.write(f"{storage_class:20s}: {data['count']:>8,} objects, "
-                           f"{data['size_gb']:>10.2f} GB, ${monthly_cost:>8.2f}/month\n")
-                f.write("\n")
-                
-                # Top prefixes (folders)
-                f.write("TOP 10 PREFIXES BY SIZE\n")
-                f.write("-" * 80 + "\n")
-                sorted_prefixes = sorted(analysis['by_prefix'].items(), 
-                                       key=lambda x: x[1]['size_gb'], reverse=True)[:10]
-                for prefix, data in sorted_prefixes:
-                    f.write(f"{prefix[:60]:60s}: {data['count']:>8,} objects, {data['size_gb']:>10.2f} GB\n")
-                f.write("\n")
-                
-                # Candidates for Standard-IA
-                if analysis['candidates_for_ia']:
-                    f.write("CANDIDATES FOR STANDARD-IA (Top 20 by size)\n")
-                    f.write("-" * 80 + "\n")
-                    f.write(f"Total candidates: {len(analysis['candidates_for_ia'])}\n")
-                    total_savings = sum(obj['potential_savings_monthly'] 
-                                      for obj in analysis['candidates_for_ia'])
-                    f.write(f"Potential monthly savings: ${total_savings:.2f}\n\n")
-                    
-                    sorted_ia = sorted(analysis['candidates_for_ia'], 
-                                     key=lambda x: x['size_gb'], reverse=True)[:20]
-                    for obj in sorted_ia:
-                        f.write(f"  {obj['key'][:70]}\n")
-                        f.write(f"    Size: {obj['size_gb']:.4f} GB, Age: {obj['age_days']} days, "
-                               f"Savings: ${obj['potential_savings_monthly']:.2f}/month\n")
-                    f.write("\n")
-                
-                # Candidates for Glacier
-                if analysis['candidates_for_glacier']:
-                    f.write("CANDIDATES FOR GLACIER (Top 20 by savings)\n")
-                    f.write("-" * 80 + "\n")
-                    f.write(f"Total candidates: {len(analysis['candidates_for_glacier'])}\n")
-                    total_savings = sum(obj['potential_savings_monthly'] 
-                                      for obj in analysis['candidates_for_glacier'])
-                    f.write(f"Potential monthly savings: ${total_savings:.2f}\n\n")
-                    
-                    sorted_glacier = sorted(analysis['candidates_for_glacier'], 
-                                          key=lambda x: x['potential_savings_monthly'], 
-                                          reverse=True)[:20]
-                    for obj in sorted_glacier:
-                        f.write(f"  {obj['key'][:70]}\n")
-                        f.write(f"    Size: {obj['size_gb']:.4f} GB, Age: {obj['age_days']} days, "
-                               f"Current: {obj['current_storage_class']}, "
-                               f"Savings: ${obj['potential_savings_monthly']:.2f}/month\n")
-                    f.write("\n")
-                
-                # Old objects summary
-                if analysis['old_objects']:
-                    total_old_size = sum(obj['size_gb'] for obj in analysis['old_objects'])
-                    f.write(f"OLD OBJECTS (>90 days, not accessed recently)\n")
-                    f.write("-" * 80 + "\n")
-                    f.write(f"Total old objects: {len(analysis['old_objects'])}\n")
-                    f.write(f"Total size: {total_old_size:.2f} GB\n")
-                    f.write("Review these objects for potential deletion\n\n")
-                
-                f.write("\n")
+            for obj in analysis['candidates_for_ia']:
+                f.write(f"  {obj['key'][:70]}\n")
+                f.write(f"    Size: {obj['size_gb']:.4f} GB, Age: {obj['age_days']} days, "
+                       f"Savings: ${obj['potential_savings_monthly']:.2f}/month\n")
+            f.write("\n")
+        
+        # Candidates for Glacier
+        if analysis['candidates_for_glacier']:
+            f.write("CANDIDATES FOR GLACIER (Top 20 by savings)\n")
+            f.write("-" * 80 + "\n")
+            f.write(f"Total candidates: {analysis['candidates_for_glacier_count']}\n")
+            f.write(f"Potential monthly savings: ${analysis['candidates_for_glacier_savings']:.2f}\n\n")
             
-            # Multipart uploads analysis
-            f.write("=" * 80 + "\n")
-            f.write("INCOMPLETE MULTIPART UPLOADS\n")
-            f.write("=" * 80 + "\n\n")
+            for obj in analysis['candidates_for_glacier']:
+                f.write(f"  {obj['key'][:70]}\n")
+                f.write(f"    Size: {obj['size_gb']:.4f} GB, Age: {obj['age_days']} days, "
+                       f"Current: {obj['current_storage_class']}, "
+                       f"Savings: ${obj['potential_savings_monthly']:.2f}/month\n")
+            f.write("\n")
+        
+        # Old objects summary
+        if analysis['old_objects_count']:
+            f.write(f"OLD OBJECTS (>90 days, not accessed recently)\n")
+            f.write("-" * 80 + "\n")
+            f.write(f"Total old objects: {analysis['old_objects_count']}\n")
+            f.write(f"Total size: {analysis['old_objects_size_gb']:.2f} GB\n")
+            f.write("Review these objects for potential deletion\n\n")
+        
+        f.write("\n")
+
+    def write_multipart_section(self, f, mp_analysis):
+        """Write the incomplete multipart upload section for one bucket"""
+        f.write(f"Bucket: {mp_analysis['bucket_name']}\n")
+        f.write("-" * 80 + "\n")
+        
+        if 'error' in mp_analysis:
+            f.write(f"ERROR: {mp_analysis['error']}\n\n")
+            return
+        
+        f.write(f"Total incomplete uploads: {mp_analysis['total_uploads']}\n")
+        f.write(f"Old uploads (>7 days): {len(mp_analysis['old_uploads'])}\n")
+        sizes_measured = mp_analysis['sizes_measured']
+        if sizes_measured:
+            f.write(f"Estimated storage: {mp_analysis['estimated_storage_gb']:.2f} GB\n")
+        else:
+            f.write("Estimated storage: not measured (--fast-multipart)\n")
+        
+        if mp_analysis['old_uploads']:
+            if sizes_measured:
+                monthly_cost = mp_analysis['estimated_storage_gb'] * self.pricing['STANDARD']
+                f.write(f"Estimated monthly cost: ${monthly_cost:.2f}\n")
+            f.write("\n")
             
-            for mp_analysis in multipart_analyses:
-                f.write(f"Bucket: {mp_analysis['bucket_name']}\n")
-                f.write("-" * 80 + "\n")
-                
-                if 'error' in mp_analysis:
-                    f.write(f"ERROR: {mp_analysis['error']}\n\n")
-                    continue
+            f.write("Old incomplete uploads:\n")
+            for upload in nlargest(50, mp_analysis['old_uploads'], key=itemgetter('age_days')):
+                f.write(f"  {upload['key'][:70]}\n")
+                if sizes_measured:
+                    f.write(f"    Age: {upload['age_days']} days, Size: {upload['size_gb']:.4f} GB\n")
+                else:
+                    f.write(f"    Age: {upload['age_days']} days\n")
+                f.write(f"    Upload ID: {upload['upload_id']}\n")
+        f.write("\n")
+
+    def write_recommendations(self, f):
+        """Write the closing recommendations"""
+        f.write("=" * 80 + "\n")
+        f.write("RECOMMENDATIONS\n")
+        f.write("=" * 80 + "\n\n")
+        f.write("1. LIFECYCLE POLICIES\n")
+        f.write("   - Create lifecycle policies to automatically transition objects to IA after 30 days\n")
+        f.write("   - Transition rarely accessed objects to Glacier after 180 days\n")
+        f.write("   - Enable Intelligent-Tiering for objects with unpredictable access patterns\n\n")
+        f.write("2. MULTIPART UPLOADS\n")
+        f.write("   - Abort incomplete multipart uploads older than 7 days\n")
+        f.write("   - Create lifecycle policy to automatically abort incomplete uploads\n\n")
+        f.write("3. DATA CLEANUP\n")
+        f.write("   - Review old objects (>90 days) for potential deletion\n")
+        f.write("   - Implement data retention policies\n\n")
+        f.write("4. MONITORING\n")
+        f.write("   - Enable S3 Storage Lens for ongoing cost monitoring\n")
+        f.write("   - Set up CloudWatch metrics for bucket-level monitoring\n\n")
+
+    def generate_report(self, results, output_file='s3_cost_report.txt'):
+        """Generate the text and JSON reports from (kind, analysis) pairs as they complete.
+        
+        kind is 'bucket' or 'multipart'. Sections are spooled to temporary files as
+        each analysis arrives, so only the running totals are held in memory; the
+        summary is written on top once every bucket is in.
+        """
+        totals = {
+            'total_buckets': 0,
+            # Counted in total_buckets but not in the object and size totals
+            'skipped_optimized_buckets': 0,
+            'total_objects': 0,
+            'total_size_gb': 0,
+            'potential_ia_savings_monthly': 0,
+            'potential_glacier_savings_monthly': 0,
+            'multipart_storage_gb': 0
+        }
+        multipart_measured = True
+        
+        with tempfile.TemporaryFile('w+') as bucket_text, \
+             tempfile.TemporaryFile('w+') as multipart_text, \
+             tempfile.TemporaryFile('w+') as bucket_json, \
+             tempfile.TemporaryFile('w+') as multipart_json:
+            for kind, analysis in results:
+                if kind == 'bucket':
+                    bucket_text.write(_render(self.write_bucket_section, analysis))
+                    _write_json_item(bucket_json, _bucket_json(analysis))
+                    totals['total_buckets'] += 1
+                    totals['skipped_optimized_buckets'] += 'already_optimized' in analysis
+                    totals['total_objects'] += analysis['total_objects']
+                    totals['total_size_gb'] += analysis['total_size_gb']
+                    totals['potential_ia_savings_monthly'] += analysis['candidates_for_ia_savings']
+                    totals['potential_glacier_savings_monthly'] += analysis['candidates_for_glacier_savings']
+                else:
+                    multipart_text.write(_render(self.write_multipart_section, analysis))
+                    _write_json_item(multipart_json, analysis)
+                    totals['multipart_storage_gb'] += analysis['estimated_storage_gb']
+                    multipart_measured = multipart_measured and analysis['sizes_measured']
+            
+            # Each piece reaches the file in one write (or in large copy
+            # chunks for the spooled sections) rather than line by line
+            with open(output_file, 'w') as f:
+                f.write(_render(self.write_report_header) + _render(self.write_summary, totals, multipart_measured))
+                bucket_text.seek(0)
+                shutil.copyfileobj(bucket_text, f)
                 
-                f.write(f"Total incomplete uploads: {mp_analysis['total_uploads']}\n")
-                f.write(f"Old uploads (>7 days): {len(mp_analysis['old_uploads'])}\n")
-                f.write(f"Estimated storage: {mp_analysis['estimated_storage_gb']:.2f} GB\n")
+                f.write("=" * 80 + "\n" + "INCOMPLETE MULTIPART UPLOADS\n" + "=" * 80 + "\n\n")
+                multipart_text.seek(0)
+                shutil.copyfileobj(multipart_text, f)
                 
-                if mp_analysis['old_uploads']:
-                    monthly_cost = mp_analysis['estimated_storage_gb'] * self.pricing['STANDARD']
-                    f.write(f"Estimated monthly cost: ${monthly_cost:.2f}\n\n")
-                    
-                    f.write("Old incomplete uploads:\n")
-                    for upload in sorted(mp_analysis['old_uploads'], 
-                                       key=lambda x: x['age_days'], reverse=True)[:50]:
-                        f.write(f"  {upload['key'][:70]}\n")
-                        f.write(f"    Age: {upload['age_days']} days, Size: {upload['size_gb']:.4f} GB\n")
-                        f.write(f"    Upload ID: {upload['upload_id']}\n")
-                f.write("\n")
+                f.write(_render(self.write_recommendations))
             
-            # Recommendations
-            f.write("=" * 80 + "\n")
-            f.write("RECOMMENDATIONS\n")
-            f.write("=" * 80 + "\n\n")
-            f.write("1. LIFECYCLE POLICIES\n")
-            f.write("   - Create lifecycle policies to automatically transition objects to IA after 30 days\n")
-            f.write("   - Transition rarely accessed objects to Glacier after 180 days\n")
-            f.write("   - Enable Intelligent-Tiering for objects with unpredictable access patterns\n\n")
-            f.write("2. MULTIPART UPLOADS\n")
-            f.write("   - Abort incomplete multipart uploads older than 7 days\n")
-            f.write("   - Create lifecycle policy to automatically abort incomplete uploads\n\n")
-            f.write("3. DATA CLEANUP\n")
-            f.write("   - Review old objects (>90 days) for potential deletion\n")
-            f.write("   - Implement data retention policies\n\n")
-            f.write("4. MONITORING\n")
-            f.write("   - Enable S3 Storage Lens for ongoing cost monitoring\n")
-            f.write("   - Set up CloudWatch metrics for bucket-level monitoring\n\n")
-        
-        print(f"\nReport written to: {output_file}")
-        
-        # Also generate JSON for programmatic use
-        json_output = output_file.replace('.txt', '.json')
-        with open(json_output, 'w') as f:
-            json.dump({
-                'bucket_analyses': bucket_analyses,
-                'multipart_analyses': multipart_analyses,
-                'summary': {
-                    'total_buckets': len(bucket_analyses),
-                    'total_objects': total_objects,
-                    'total_size_gb': total_size,
-                    'potential_ia_savings_monthly': total_ia_savings,
-                    'potential_glacier_savings_monthly': total_glacier_savings,
-                    'multipart_storage_gb': total_multipart_storage
-                }
-            }, f, indent=2, default=str)
-        print(f"JSON data written to: {json_output}")
+            print(f"\nReport written to: {output_file}")
+            
+            # Also generate JSON for programmatic use, one compactly encoded
+            # analysis per line
+            json_output = output_file.replace('.txt', '.json')
+            with open(json_output, 'w') as f:
+                f.write('{\n"bucket_analyses": [\n')
+                bucket_json.seek(0)
+                shutil.copyfileobj(bucket_json, f)
+                f.write('\n],\n"multipart_analyses": [\n')
+                multipart_json.seek(0)
+                shutil.copyfileobj(multipart_json, f)
+                f.write(f'\n],\n"summary": {json.dumps(totals, default=str)}\n}}\n')
+            print(f"JSON data written to: {json_output}")
 
 
 def main():
@@ -393,10 +964,35 @@ def main():
                        help='Age threshold for old objects (default: 90 days)')
     parser.add_argument('--multipart-days', type=int, default=7,
                        help='Age threshold for old multipart uploads (default: 7 days)')
+    parser.add_argument('--fast-multipart', action='store_true',
+                       help='Report stale multipart uploads without listing their parts (sizes not measured)')
+    parser.add_argument('--skip-optimized', action='store_true',
+                       help='Skip the object walk for buckets whose lifecycle rules already transition objects '
+                            'to IA and Glacier (their objects are left out of the totals)')
+    parser.add_argument('--inventory', action='store_true',
+                       help='Read each bucket\'s CSV S3 Inventory report instead of listing objects, '
+                            'falling back to listing when none is configured')
+    parser.add_argument('--inventory-bucket',
+                       help='Bucket inventory reports are delivered to (implies --inventory)')
+    parser.add_argument('--inventory-prefix', default='',
+                       help='Destination prefix of the inventory reports in --inventory-bucket')
     
     args = parser.parse_args()
     
-    analyzer = S3CostAnalyzer(region_name=args.region)
+    skip_optimized = args.skip_optimized
+    cache_file = lifecycle_cache_path(args.output)
+    analyzer = S3CostAnalyzer(region_name=args.region, use_inventory=args.inventory,
+                              inventory_bucket=args.inventory_bucket,
+                              inventory_prefix=args.inventory_prefix,
+                              skip_optimized=skip_optimized,
+                              lifecycle_cache=load_lifecycle_cache(cache_file) if skip_optimized else {})
+    
+    # Check the SSO session once up front rather than from every worker
+    if analyzer.is_sso_session_valid():
+        print(f"✅ AWS SSO session for profile '{analyzer.profile}' is still valid.")
+    else:
+        print(f"⚠️  AWS SSO session for profile '{analyzer.profile}' has expired.")
+        analyzer.login_sso()
     
     # Get bucket list
     if args.buckets:
@@ -410,19 +1006,23 @@ def main():
     
     print(f"Analyzing {len(buckets)} bucket(s)...\n")
     
-    # Analyze each bucket
-    bucket_analyses = []
-    multipart_analyses = []
-    
-    for bucket in buckets:
-        analysis = analyzer.analyze_bucket_objects(bucket, days_threshold=args.days_threshold)
-        bucket_analyses.append(analysis)
+    # Each bucket is dominated by S3 API latency, so analyze them concurrently
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(buckets))) as executor:
+        futures = {}
+        for bucket in buckets:
+            futures[executor.submit(analyzer.analyze_bucket_objects, bucket,
+                                    days_threshold=args.days_threshold)] = 'bucket'
+            futures[executor.submit(analyzer.analyze_multipart_uploads, bucket,
+                                    days_threshold=args.multipart_days,
+                                    fast=args.fast_multipart)] = 'multipart'
         
-        mp_analysis = analyzer.analyze_multipart_uploads(bucket, days_threshold=args.multipart_days)
-        multipart_analyses.append(mp_analysis)
+        # Report sections are written in completion order; popping each future
+        # lets its analysis be freed once its section is on disk
+        results = ((futures.pop(future), future.result()) for future in as_completed(futures))
+        analyzer.generate_report(results, output_file=args.output)
     
-    # Generate report
-    analyzer.generate_report(bucket_analyses, multipart_analyses, output_file=args.output)
+    if skip_optimized:
+        save_lifecycle_cache(cache_file, analyzer.lifecycle_cache)
     
     print("\nAnalysis complete!")
 